@@ -30,6 +30,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "web.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -74,6 +75,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Shared by all gunicorn workers; create the table with ./manage.py createcachetable
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "awards_cache",
+        # counters, ballots, grids and field groups add keys per reviewer,
+        # category and entry; the default of 300 would cull on every write
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -110,6 +126,21 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "../frontend/dist"),
 ]
 
+
+# Request profiling
+# Share of requests (0 to 1) to log view time, query counts, repeated and
+# slowest queries for; see web/middleware.py
+
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 0))
+PROFILING_SERVER_TIMING = False
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"web.profiling": {"handlers": ["console"], "level": "INFO"}},
+}
+
 sentry_sdk.init(
     # dsn="https://82049105e6cd4ab794b3f4a513451a07@sentry.legit.si/1",
     integrations=[DjangoIntegration()],
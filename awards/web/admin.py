@@ -1,6 +1,14 @@
 from django.contrib import admin
 
-from .models import Entry, Category, Rating
+from .models import (
+    Entry,
+    Category,
+    Rating,
+    SyncWatermark,
+    EntryScore,
+    OutboxEmail,
+    ReviewerProfile,
+)
 
 
 @admin.register(Entry)
@@ -18,3 +26,31 @@ class CategoryAdmin(admin.ModelAdmin):
 class RatingAdmin(admin.ModelAdmin):
     list_display = ["__str__", "updated", "status", "user"]
     list_filter = ["status", "user"]
+
+
+@admin.register(EntryScore)
+class EntryScoreAdmin(admin.ModelAdmin):
+    list_display = ["entry", "count", "mean", "minimum", "maximum", "stddev"]
+    list_filter = ["entry__category"]
+    list_select_related = ["entry"]
+    ordering = ["-mean"]
+
+
+@admin.register(SyncWatermark)
+class SyncWatermarkAdmin(admin.ModelAdmin):
+    list_display = ["name", "date_updated", "updated"]
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ["subject", "to", "status", "attempts", "created", "sent"]
+    list_filter = ["status"]
+    search_fields = ["to"]
+    readonly_fields = ["created", "sent", "last_error"]
+
+
+@admin.register(ReviewerProfile)
+class ReviewerProfileAdmin(admin.ModelAdmin):
+    list_display = ["user", "institution", "country"]
+    list_select_related = ["user"]
+    search_fields = ["user__email", "institution", "country"]
@@ -0,0 +1,80 @@
+"""
+Predictable conflicts of interest between reviewers and entries.
+
+A reviewer conflicts with an entry when their profile's institution matches
+the nominee's or nominator's institution, or their country matches the
+entry's. Values are compared after normalization (case, accents,
+punctuation), and the index is built once from two queries so assignment
+code can check any (entry, user) pair in O(1).
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from .models import Entry, ReviewerProfile
+
+NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(value):
+    value = unicodedata.normalize("NFKD", str(value or ""))
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return NON_WORD.sub(" ", value.casefold()).strip()
+
+
+class AffinityIndex:
+    def __init__(self, reviewers, entries):
+        """
+        `reviewers` are (user_id, institution, country) rows and `entries`
+        are (entry_id, institutions, country) rows.
+        """
+        by_institution = defaultdict(set)
+        by_country = defaultdict(set)
+        for user_id, institution, country in reviewers:
+            if normalize(institution):
+                by_institution[normalize(institution)].add(user_id)
+            if normalize(country):
+                by_country[normalize(country)].add(user_id)
+
+        # (entry_id, user_id) -> reason
+        self.conflicts = {}
+        for entry_id, institutions, country in entries:
+            for institution in institutions:
+                for user_id in by_institution.get(normalize(institution), ()):
+                    self.conflicts.setdefault((entry_id, user_id), "same institution")
+            for user_id in by_country.get(normalize(country), ()):
+                self.conflicts.setdefault((entry_id, user_id), "same country")
+
+    def __contains__(self, pair):
+        return pair in self.conflicts
+
+    def __len__(self):
+        return len(self.conflicts)
+
+    def get_conflict(self, entry_id, user_id):
+        return self.conflicts.get((entry_id, user_id))
+
+    @classmethod
+    def build(cls, category_id=None, entry_id=None):
+        """
+        Index of all reviewers against all entries, one category's or one
+        entry.
+        """
+        entries = Entry.objects.all()
+        if category_id is not None:
+            entries = entries.filter(category_id=category_id)
+        if entry_id is not None:
+            entries = entries.filter(pk=entry_id)
+
+        rows = entries.values_list(
+            "pk", "institution", "nominator_institution", "country"
+        )
+        return cls(
+            ReviewerProfile.objects.filter(user__is_staff=False).values_list(
+                "user_id", "institution", "country"
+            ),
+            [
+                (entry_id, [institution, nominator_institution], country)
+                for entry_id, institution, nominator_institution, country in rows
+            ],
+        )
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class WebConfig(AppConfig):
-    name = 'web'
+    name = "web"
+
+    def ready(self):
+        from . import signals  # noqa: F401
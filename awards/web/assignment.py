@@ -0,0 +1,312 @@
+import datetime
+import hashlib
+import heapq
+import json
+import random
+import statistics
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import ballots, counters, grids
+from .affinity import AffinityIndex
+from .models import Entry, Rating, delete_rows
+
+
+class Allocation:
+    def __init__(self, loads):
+        self.ballots = []
+        self.loads = loads
+        self.shortfalls = {}
+
+    def add(self, entry_id, user_id):
+        self.ballots.append((entry_id, user_id))
+        self.loads[user_id] += 1
+
+    def get_stats(self, reviewers):
+        loads = [self.loads[user_id] for user_id in reviewers] or [0]
+        return {
+            "ballots": len(self.ballots),
+            "min": min(loads),
+            "max": max(loads),
+            "mean": round(statistics.mean(loads), 2),
+            "stdev": round(statistics.pstdev(loads), 2),
+            "short_entries": len(self.shortfalls),
+            "short_ballots": sum(self.shortfalls.values()),
+        }
+
+
+def allocate(
+    entries,
+    reviewers,
+    reviews,
+    cap,
+    existing=(),
+    excluded_pairs=(),
+    excluded_categories=None,
+    seed=None,
+):
+    """
+    Tops up every entry to `reviews` ballots in a single pass.
+
+    `entries` are (entry_id, category_id) pairs, `reviewers` are user ids
+    and `existing` are (entry_id, user_id, status) rows of ballots already
+    handed out; conflicts don't count towards anyone's load. Each entry goes
+    to the eligible reviewers with the lowest load so far, ties broken by a
+    generator seeded with `seed`. Reviewers at `cap` ballots, (entry, user)
+    pairs in `excluded_pairs` and categories in `excluded_categories[user_id]`
+    are skipped. Entries that can't be filled are reported in
+    `Allocation.shortfalls` instead of retried.
+    """
+    rng = random.Random(seed)
+    excluded_categories = excluded_categories or {}
+
+    loads = Counter()
+    coverage = Counter()
+    taken = set()
+    for entry_id, user_id, status in existing:
+        taken.add((entry_id, user_id))
+        if status != "conflict":
+            loads[user_id] += 1
+            coverage[entry_id] += 1
+
+    allocation = Allocation(loads)
+
+    order = list(entries)
+    rng.shuffle(order)
+
+    for entry_id, category_id in order:
+        missing = reviews - coverage[entry_id]
+        if missing <= 0:
+            continue
+
+        candidates = [
+            user_id
+            for user_id in reviewers
+            if loads[user_id] < cap
+            and (entry_id, user_id) not in taken
+            and (entry_id, user_id) not in excluded_pairs
+            and category_id not in excluded_categories.get(user_id, ())
+        ]
+        tiebreak = {user_id: rng.random() for user_id in candidates}
+        chosen = heapq.nsmallest(
+            missing, candidates, key=lambda user_id: (loads[user_id], tiebreak[user_id])
+        )
+
+        for user_id in chosen:
+            allocation.add(entry_id, user_id)
+            taken.add((entry_id, user_id))
+
+        if len(chosen) < missing:
+            allocation.shortfalls[entry_id] = missing - len(chosen)
+
+    return allocation
+
+
+OPEN_STATUSES = ["empty", "draft"]
+
+
+class Rebalance:
+    def __init__(self, open_loads):
+        # (entry_id, from_user_id, to_user_id)
+        self.moves = []
+        self.additions = []
+        self.open_loads = open_loads
+        self.shortfalls = {}
+
+    def get_assign(self):
+        return [(entry_id, to_user) for entry_id, _, to_user in self.moves] + list(
+            self.additions
+        )
+
+    def get_unassign(self):
+        return [(entry_id, from_user) for entry_id, from_user, _ in self.moves]
+
+    def get_digest(self):
+        """
+        Fingerprint of the planned changes, to check that a plan about to be
+        applied is the one that was previewed.
+        """
+        changes = json.dumps([sorted(self.moves), sorted(self.additions)])
+        return hashlib.sha256(changes.encode()).hexdigest()
+
+    def get_stats(self):
+        return {
+            "moves": len(self.moves),
+            "additions": len(self.additions),
+            "short_entries": len(self.shortfalls),
+            "short_ballots": sum(self.shortfalls.values()),
+        }
+
+
+def rebalance(
+    entries,
+    reviewers,
+    ratings,
+    reviews,
+    stale_before,
+    cap=None,
+    excluded_pairs=(),
+    seed=None,
+):
+    """
+    Plans how to get every entry to `reviews` done ratings from one snapshot.
+
+    `entries` are entry ids, `reviewers` user ids and `ratings` are
+    (entry_id, user_id, status, updated) rows. A reviewer whose latest
+    rating change is older than `stale_before` is stalled. An entry counts
+    its done ratings and the open (empty or draft) ballots of reviewers who
+    aren't stalled; for each review still missing, a stalled ballot on the
+    entry is moved to an active reviewer, or a new ballot is added. Active
+    reviewers with the fewest open ballots are picked first, up to `cap`
+    open ballots each, skipping `excluded_pairs` and reviewers who already
+    have a rating of the entry. Entries are handled fewest reviews first.
+    """
+    rng = random.Random(seed)
+
+    last_activity = {}
+    open_loads = Counter()
+    taken = set()
+    for entry_id, user_id, status, updated in ratings:
+        taken.add((entry_id, user_id))
+        if status in OPEN_STATUSES:
+            open_loads[user_id] += 1
+        if user_id not in last_activity or updated > last_activity[user_id]:
+            last_activity[user_id] = updated
+
+    stalled_users = {
+        user_id for user_id, updated in last_activity.items() if updated < stale_before
+    }
+
+    coverage = Counter()
+    stalled = defaultdict(list)
+    for entry_id, user_id, status, updated in ratings:
+        if status == "done":
+            coverage[entry_id] += 1
+        elif status in OPEN_STATUSES:
+            if user_id in stalled_users:
+                stalled[entry_id].append(user_id)
+            else:
+                coverage[entry_id] += 1
+
+    active = [user_id for user_id in reviewers if user_id not in stalled_users]
+    plan = Rebalance(open_loads)
+
+    tiebreak = {entry_id: rng.random() for entry_id in entries}
+    order = sorted(
+        entries, key=lambda entry_id: (coverage[entry_id], tiebreak[entry_id])
+    )
+
+    for entry_id in order:
+        missing = reviews - coverage[entry_id]
+        if missing <= 0:
+            continue
+
+        candidates = [
+            user_id
+            for user_id in active
+            if (cap is None or open_loads[user_id] < cap)
+            and (entry_id, user_id) not in taken
+            and (entry_id, user_id) not in excluded_pairs
+        ]
+        user_tiebreak = {user_id: rng.random() for user_id in candidates}
+        chosen = heapq.nsmallest(
+            missing,
+            candidates,
+            key=lambda user_id: (open_loads[user_id], user_tiebreak[user_id]),
+        )
+
+        for user_id in chosen:
+            if stalled[entry_id]:
+                from_user = stalled[entry_id].pop()
+                plan.moves.append((entry_id, from_user, user_id))
+                open_loads[from_user] -= 1
+            else:
+                plan.additions.append((entry_id, user_id))
+            open_loads[user_id] += 1
+            taken.add((entry_id, user_id))
+
+        if len(chosen) < missing:
+            plan.shortfalls[entry_id] = missing - len(chosen)
+
+    return plan
+
+
+def plan_rebalance(
+    reviews, stale_days, cap=None, category_id=None, seed=None, lock=False
+):
+    """
+    Runs `rebalance` over the current ratings, for the entries of one
+    category or all of them, skipping predictable conflicts.
+
+    With `lock` the ratings stay locked until the surrounding transaction
+    ends, so the plan can be checked and applied before they change.
+    """
+    entries = Entry.objects.all()
+    if category_id is not None:
+        entries = entries.filter(category_id=category_id)
+
+    ratings = Rating.objects.all()
+    if lock:
+        ratings = ratings.select_for_update()
+
+    return rebalance(
+        list(entries.values_list("pk", flat=True)),
+        list(
+            User.objects.filter(is_staff=False, is_active=True).values_list(
+                "pk", flat=True
+            )
+        ),
+        list(ratings.values_list("entry_id", "user_id", "status", "updated")),
+        reviews,
+        timezone.now() - datetime.timedelta(days=stale_days),
+        cap=cap,
+        excluded_pairs=AffinityIndex.build(category_id),
+        seed=seed,
+    )
+
+
+def apply_assignments(assign=(), unassign=()):
+    """
+    Hands out blank ballots for the (entry_id, user_id) pairs in `assign`
+    and takes back the ones in `unassign`, in one transaction.
+
+    Completed ratings are never taken back. Ballots are created with one
+    INSERT and deleted with one DELETE, neither of which sends signals, so
+    the caches they affect are reset here once.
+    """
+    if not assign and not unassign:
+        return
+
+    with transaction.atomic():
+        Rating.objects.bulk_create(
+            [
+                Rating(entry_id=entry_id, user_id=user_id, status="empty")
+                for entry_id, user_id in assign
+            ],
+            ignore_conflicts=True,
+        )
+
+        if unassign:
+            pairs = Q()
+            for entry_id, user_id in unassign:
+                pairs |= Q(entry_id=entry_id, user_id=user_id)
+            delete_rows(Rating.objects.filter(pairs).exclude(status="done"))
+
+        changed = list(assign) + list(unassign)
+        user_ids = {user_id for entry_id, user_id in changed}
+        category_ids = set(
+            Entry.objects.filter(
+                pk__in={entry_id for entry_id, user_id in changed}
+            ).values_list("category_id", flat=True)
+        )
+        transaction.on_commit(counters.reset)
+        transaction.on_commit(lambda: ballots.clear_users(user_ids))
+        transaction.on_commit(lambda: grids.touch(category_ids))
+
+
+def apply_rebalance(plan):
+    apply_assignments(plan.get_assign(), plan.get_unassign())
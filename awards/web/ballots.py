@@ -0,0 +1,78 @@
+"""
+Per-reviewer cache of the ballots listed on the submissions page.
+
+A reviewer's cached list is deleted when one of their ratings is saved or
+deleted, or when they're part of a batch assignment. Changes that can
+touch anyone's list (imports, init_ratings) call `reset()`, which bumps a
+version stored next to every cached list.
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import Rating
+
+VERSION_KEY = "ballots:version"
+STATUS_GROUPS = {
+    "empty": "draft_entries",
+    "draft": "draft_entries",
+    "done": "done_entries",
+    "conflict": "conflict_entries",
+}
+TIMEOUT = 24 * 60 * 60
+
+
+def get_key(user_id):
+    return "ballots:user:{}".format(user_id)
+
+
+def get_ballots(user):
+    """
+    The user's ratings with their entries, grouped by status as
+    `draft_entries`, `done_entries` and `conflict_entries`.
+    """
+    key = get_key(user.pk)
+    values = cache.get_many([VERSION_KEY, key])
+
+    version = values.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        cache.add(VERSION_KEY, version, None)
+
+    cached = values.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    ballots = build_ballots(user)
+    cache.set(key, (version, ballots), TIMEOUT)
+    return ballots
+
+
+def build_ballots(user):
+    ballots = {group: [] for group in STATUS_GROUPS.values()}
+
+    ratings = (
+        Rating.objects.filter(user=user)
+        .select_related("entry__category")
+        .defer("entry__data")
+        .order_by("entry__category", "entry__subcategory")
+    )
+    for rating in ratings:
+        ballots[STATUS_GROUPS[rating.status]].append(rating)
+
+    return ballots
+
+
+def clear_user(user_id):
+    cache.delete(get_key(user_id))
+
+
+def clear_users(user_ids):
+    cache.delete_many([get_key(user_id) for user_id in user_ids])
+
+
+def reset():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
@@ -0,0 +1,158 @@
+"""
+Rating status counters kept in Django's cache.
+
+Counts are grouped the same way as the rating managers (dones, drafts,
+conflicts) and kept for all ratings and per category, reviewer and entry,
+each scope as one map under one key. Signal handlers adjust the cached
+numbers as ratings are saved or deleted; counts that aren't cached are
+recomputed with one grouped query. Code that writes ratings in bulk,
+bypassing signals, calls `reset()`.
+"""
+import time
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Entry, Rating
+
+GROUPS = ["dones", "drafts", "conflicts"]
+STATUS_GROUPS = {
+    "empty": "drafts",
+    "draft": "drafts",
+    "conflict": "conflicts",
+    "done": "dones",
+}
+SCOPES = {
+    "all": None,
+    "category": "entry__category_id",
+    "user": "user_id",
+    "entry": "entry_id",
+}
+VERSION_KEY = "counters:version"
+# concurrent updates aren't atomic, so let drifted numbers expire
+TIMEOUT = 10 * 60
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # not 1, so counts cached under an evicted version aren't reused
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def reset():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def make_key(scope, version=None):
+    return "counters:{}:{}".format(version or get_version(), scope)
+
+
+def empty_counts():
+    return {group: 0 for group in GROUPS}
+
+
+def compute_counts(scope):
+    field = SCOPES[scope]
+    fields = ["status"] if field is None else [field, "status"]
+    rows = Rating.objects.values(*fields).annotate(count=Count("pk")).order_by()
+
+    counts = {}
+    for row in rows:
+        scope_counts = counts.setdefault(row.get(field), empty_counts())
+        scope_counts[STATUS_GROUPS[row["status"]]] += row["count"]
+    return counts
+
+
+def get_counts(scope):
+    key = make_key(scope)
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute_counts(scope)
+        cache.set(key, counts, TIMEOUT)
+    return counts
+
+
+def get_global_counts():
+    return get_counts("all").get(None, empty_counts())
+
+
+def get_scoped_counts(scope, ids):
+    counts = get_counts(scope)
+    return {pk: counts.get(pk, empty_counts()) for pk in ids}
+
+
+def get_user_counts(user_ids):
+    return get_scoped_counts("user", user_ids)
+
+
+def get_entry_counts(entry_ids):
+    return get_scoped_counts("entry", entry_ids)
+
+
+def annotate_entries(entries):
+    """
+    Sets `num_dones`, `num_drafts` and `num_conflicts` on `entries`, as
+    `EntryQuerySet.with_status_counts()` would, from the cached counts.
+    """
+    entries = list(entries)
+    if not entries:
+        return entries
+    counts = get_entry_counts([entry.pk for entry in entries])
+    for entry in entries:
+        for group, value in counts[entry.pk].items():
+            setattr(entry, "num_" + group, value)
+    return entries
+
+
+def get_scope_ids(rating):
+    if Rating.entry.is_cached(rating):
+        category_id = rating.entry.category_id
+    else:
+        category_id = (
+            Entry.objects.filter(pk=rating.entry_id)
+            .values_list("category_id", flat=True)
+            .first()
+        )
+
+    return {
+        "all": None,
+        "category": category_id,
+        "user": rating.user_id,
+        "entry": rating.entry_id,
+    }
+
+
+def group_changed(old_status, new_status):
+    return STATUS_GROUPS.get(old_status) != STATUS_GROUPS.get(new_status)
+
+
+def rating_changed(scope_ids, old_status, new_status):
+    """
+    Moves one rating from the group of `old_status` to that of `new_status`
+    in the cached counts of the scopes in `scope_ids` (see `get_scope_ids`).
+    """
+    old_group = STATUS_GROUPS.get(old_status)
+    new_group = STATUS_GROUPS.get(new_status)
+    if old_group == new_group:
+        return
+
+    version = get_version()
+    for scope, scope_id in scope_ids.items():
+        key = make_key(scope, version)
+        counts = cache.get(key)
+        if counts is None:
+            # not cached, will be computed on the next read
+            continue
+
+        scope_counts = counts.setdefault(scope_id, empty_counts())
+        if old_group:
+            scope_counts[old_group] = max(scope_counts[old_group] - 1, 0)
+        if new_group:
+            scope_counts[new_group] += 1
+        cache.set(key, counts, TIMEOUT)
@@ -0,0 +1,450 @@
+import csv
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from django.urls import reverse
+
+from . import results
+from .models import Rating
+
+SITE_URL = "https://review.awards.oeglobal.org"
+
+CRITERIA = [
+    "access",
+    "quality",
+    "visual",
+    "engagement",
+    "inclusion",
+    "licensing",
+    "accessibility",
+    "currency",
+]
+
+REVIEW_FIELDS = [
+    "entry_id",
+    "entry__title",
+    "entry__subcategory",
+    "entry__category__name",
+    "user__first_name",
+    "user__last_name",
+    "individual",
+    "average",
+    "comment",
+] + CRITERIA
+
+
+class Link:
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+
+def get_review_rows(category=None):
+    """
+    Yields completed ratings as dicts, joined with their entry and reviewer
+    in a single query and read with a server-side cursor.
+    """
+    queryset = Rating.objects.filter(status="done")
+    if category:
+        queryset = queryset.filter(entry__category__name=category)
+
+    return (
+        queryset.order_by("entry__category__name", "entry__subcategory", "entry__id")
+        .values(*REVIEW_FIELDS)
+        .iterator(chunk_size=2000)
+    )
+
+
+def get_entry_url(entry_id):
+    return SITE_URL + reverse("entry-detail", kwargs={"pk": entry_id})
+
+
+def get_reviewer_name(row):
+    return "{} {}".format(row["user__first_name"], row["user__last_name"])
+
+
+class ReviewSheet:
+    columns = [
+        ("Subcategory", 100),
+        ("ID #", 20),
+        ("Title", 140),
+        ("Reviewer", 70),
+        ("Access", 20),
+        ("Quality", 20),
+        ("Visual", 20),
+        ("Engagement", 35),
+        ("Inclusion", 30),
+        ("Licensing", 30),
+        ("Accessibility", 40),
+        ("Currency", 30),
+        ("Average Score", 60),
+        ("Comment", 450),
+    ]
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_rows(self):
+        for row in get_review_rows(self.name):
+            yield self.format_row(row)
+
+    def format_row(self, row):
+        return (
+            [
+                row["entry__subcategory"],
+                row["entry_id"],
+                Link(get_entry_url(row["entry_id"]), row["entry__title"]),
+                get_reviewer_name(row),
+            ]
+            + [row[field] for field in CRITERIA]
+            + [row["average"], row["comment"]]
+        )
+
+
+class IndividualReviewSheet(ReviewSheet):
+    columns = [
+        ("Subcategory", 120),
+        ("ID #", 20),
+        ("Name", 80),
+        ("Reviewer", 70),
+        ("Total", 20),
+        ("Comment", 450),
+    ]
+
+    def format_row(self, row):
+        return [
+            row["entry__subcategory"],
+            row["entry_id"],
+            Link(get_entry_url(row["entry_id"]), row["entry__title"]),
+            get_reviewer_name(row),
+            row["individual"],
+            row["comment"],
+        ]
+
+
+class AllReviewsSheet(ReviewSheet):
+    columns = [
+        ("Category", 100),
+        ("Subcategory", 100),
+        ("ID #", 20),
+        ("Title", 140),
+        ("Reviewer", 70),
+        ("Access", 20),
+        ("Quality", 20),
+        ("Visual", 20),
+        ("Engagement", 35),
+        ("Inclusion", 30),
+        ("Licensing", 30),
+        ("Accessibility", 40),
+        ("Currency", 30),
+        ("Average Score", 60),
+        ("Individual Rating", 40),
+        ("Comment", 450),
+        ("Link", 100),
+    ]
+
+    def __init__(self, name="All Reviews"):
+        super().__init__(name)
+
+    def get_rows(self):
+        for row in get_review_rows():
+            yield self.format_row(row)
+
+    def format_row(self, row):
+        return (
+            [
+                row["entry__category__name"],
+                row["entry__subcategory"],
+                row["entry_id"],
+                row["entry__title"],
+                get_reviewer_name(row),
+            ]
+            + [row[field] for field in CRITERIA]
+            + [
+                row["average"],
+                row["individual"],
+                row["comment"],
+                get_entry_url(row["entry_id"]),
+            ]
+        )
+
+
+class ResultsSheet:
+    columns = [
+        ("Category", 100),
+        ("Subcategory", 100),
+        ("Rank", 20),
+        ("Subcategory Rank", 45),
+        ("ID #", 20),
+        ("Title", 140),
+        ("Reviews", 25),
+        ("Raw Mean", 30),
+        ("Normalized Mean", 45),
+        ("95% CI Low", 35),
+        ("95% CI High", 35),
+    ]
+
+    def __init__(self, name="Ranked Results"):
+        self.name = name
+
+    def get_rows(self):
+        for category in results.get_results():
+            for item in category["entries"]:
+                yield [
+                    category["name"],
+                    item["subcategory"],
+                    item["rank"],
+                    item["subcategory_rank"],
+                    item["pk"],
+                    Link(get_entry_url(item["pk"]), item["title"]),
+                    item["count"],
+                    item["raw_mean"],
+                    item["mean"],
+                    item["low"],
+                    item["high"],
+                ]
+
+
+def get_review_sheets():
+    return [
+        ResultsSheet(),
+        IndividualReviewSheet("Individual Awards"),
+        ReviewSheet("Open Assets Awards"),
+        ReviewSheet("Open Practices Awards"),
+        ReviewSheet("Special Awards"),
+    ]
+
+
+class Echo:
+    """
+    Write-only file-like object that hands back whatever is written to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(sheet):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, width in sheet.columns])
+    for row in sheet.get_rows():
+        yield writer.writerow(row)
+
+
+class StreamBuffer:
+    """
+    Unseekable file-like object that collects zip output until drained.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIP_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+DOCUMENT_RELATIONSHIP_NS = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+)
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+STYLES_XML = (
+    XML_HEADER + '<styleSheet xmlns="{ns}">'
+    '<fonts count="3">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font>'
+    '<font><u/><color rgb="FF0563C1"/><sz val="11"/><name val="Calibri"/></font>'
+    "</fonts>"
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    "</borders>"
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'
+    "</cellStyleXfs>"
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1">'
+    '<alignment wrapText="1" vertical="top"/></xf>'
+    '<xf numFmtId="0" fontId="2" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    "</cellXfs>"
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/>'
+    "</cellStyles>"
+    "</styleSheet>"
+).format(ns=SPREADSHEET_NS)
+
+HEADER_STYLE = 1
+WRAP_STYLE = 2
+LINK_STYLE = 3
+
+ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def xml_text(value):
+    return escape(ILLEGAL_XML_CHARS.sub("", str(value)))
+
+
+def column_letter(col_num):
+    letters = ""
+    while col_num:
+        col_num, remainder = divmod(col_num - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def xlsx_cell(ref, value, style):
+    if value is None or value == "":
+        return ""
+
+    if isinstance(value, Link):
+        formula = 'HYPERLINK("{}","{}")'.format(
+            value.url.replace('"', '""'), str(value.text).replace('"', '""')
+        )
+        return '<c r="{}" s="{}" t="str"><f>{}</f><v>{}</v></c>'.format(
+            ref, LINK_STYLE, xml_text(formula), xml_text(value.text)
+        )
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return '<c r="{}" s="{}"><v>{}</v></c>'.format(ref, style, value)
+
+    return '<c r="{}" s="{}" t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(
+        ref, style, xml_text(value)
+    )
+
+
+def xlsx_row(row_num, values, style):
+    return '<row r="{}">{}</row>'.format(
+        row_num,
+        "".join(
+            xlsx_cell("{}{}".format(column_letter(col_num), row_num), value, style)
+            for col_num, value in enumerate(values, 1)
+        ),
+    )
+
+
+def xlsx_package_files(sheets):
+    content_types = (
+        XML_HEADER
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + "".join(
+            '<Override PartName="/xl/worksheets/sheet{}.xml" ContentType="application/'
+            'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'.format(
+                index
+            )
+            for index in range(1, len(sheets) + 1)
+        )
+        + "</Types>"
+    )
+
+    root_rels = (
+        XML_HEADER
+        + '<Relationships xmlns="{}">'.format(RELATIONSHIP_NS)
+        + '<Relationship Id="rId1" Type="{}/officeDocument" '
+        'Target="xl/workbook.xml"/>'.format(DOCUMENT_RELATIONSHIP_NS)
+        + "</Relationships>"
+    )
+
+    workbook = (
+        XML_HEADER
+        + '<workbook xmlns="{}" xmlns:r="{}"><sheets>'.format(
+            SPREADSHEET_NS, DOCUMENT_RELATIONSHIP_NS
+        )
+        + "".join(
+            '<sheet name={} sheetId="{}" r:id="rId{}"/>'.format(
+                quoteattr(sheet.name[:31]), index, index
+            )
+            for index, sheet in enumerate(sheets, 1)
+        )
+        + "</sheets></workbook>"
+    )
+
+    workbook_rels = (
+        XML_HEADER
+        + '<Relationships xmlns="{}">'.format(RELATIONSHIP_NS)
+        + "".join(
+            '<Relationship Id="rId{}" Type="{}/worksheet" '
+            'Target="worksheets/sheet{}.xml"/>'.format(
+                index, DOCUMENT_RELATIONSHIP_NS, index
+            )
+            for index in range(1, len(sheets) + 1)
+        )
+        + '<Relationship Id="rId{}" Type="{}/styles" Target="styles.xml"/>'.format(
+            len(sheets) + 1, DOCUMENT_RELATIONSHIP_NS
+        )
+        + "</Relationships>"
+    )
+
+    return [
+        ("[Content_Types].xml", content_types),
+        ("_rels/.rels", root_rels),
+        ("xl/workbook.xml", workbook),
+        ("xl/_rels/workbook.xml.rels", workbook_rels),
+        ("xl/styles.xml", STYLES_XML),
+    ]
+
+
+def stream_xlsx(sheets, chunk_size=64 * 1024):
+    """
+    Yields an XLSX workbook piece by piece.
+
+    Rows are written as inline strings straight into the deflate stream of
+    each worksheet, so memory use doesn't depend on the number of rows.
+    """
+    buffer = StreamBuffer()
+
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in xlsx_package_files(sheets):
+            archive.writestr(name, content)
+        yield buffer.drain()
+
+        for index, sheet in enumerate(sheets, 1):
+            with archive.open("xl/worksheets/sheet{}.xml".format(index), "w") as fp:
+                cols = "".join(
+                    '<col min="{0}" max="{0}" width="{1:.1f}" customWidth="1"/>'.format(
+                        col_num, width * 100 / 256
+                    )
+                    for col_num, (name, width) in enumerate(sheet.columns, 1)
+                )
+                fp.write(
+                    (
+                        XML_HEADER
+                        + '<worksheet xmlns="{}"><cols>{}</cols><sheetData>'.format(
+                            SPREADSHEET_NS, cols
+                        )
+                        + xlsx_row(
+                            1, [name for name, width in sheet.columns], HEADER_STYLE
+                        )
+                    ).encode("utf-8")
+                )
+
+                for row_num, row in enumerate(sheet.get_rows(), 2):
+                    fp.write(xlsx_row(row_num, row, WRAP_STYLE).encode("utf-8"))
+                    if buffer.size >= chunk_size:
+                        yield buffer.drain()
+
+                fp.write(b"</sheetData></worksheet>")
+            yield buffer.drain()
+
+    yield buffer.drain()
@@ -2,7 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from django.forms import Textarea
 
-from .models import Rating
+from .models import Category, Rating
 
 
 class LoginForm(forms.Form):
@@ -23,6 +23,25 @@ class LoginForm(forms.Form):
         return cleaned_data
 
 
+class RebalanceForm(forms.Form):
+    reviews = forms.IntegerField(
+        min_value=1, initial=3, help_text="Done reviews each entry should get"
+    )
+    stale_days = forms.IntegerField(
+        min_value=0,
+        initial=7,
+        help_text="Reviewers without rating changes for this many days are stalled",
+    )
+    cap = forms.IntegerField(
+        min_value=1, required=False, help_text="Maximum open ballots per reviewer"
+    )
+    category = forms.ModelChoiceField(
+        Category.objects.order_by("name"), required=False, empty_label="All"
+    )
+    # keeps the plan that was previewed the same when it is applied
+    seed = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+
 class RatingForm(forms.ModelForm):
     is_draft = forms.BooleanField(
         label="I'm not yet done with the review", required=False
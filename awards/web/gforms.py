@@ -0,0 +1,337 @@
+import datetime
+import json
+
+import requests
+from django.conf import settings
+from django.db import transaction
+
+from . import ballots, counters, grids, results
+from .models import Category, Entry, EntryScore, Rating, SyncWatermark, delete_rows
+
+PAGE_SIZE = 300
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+ENTRY_FIELDS = [
+    "title",
+    "data",
+    "subcategory",
+    "category",
+    "country",
+    "link",
+    "institution",
+    "nominator_institution",
+]
+
+# nominator and nominee fields share labels ("First", "Email", ...)
+LABEL_PREFIXES = {
+    "N_": ["1.*", "2", "65", "24"],
+    "C_": ["5.*", "67.*", "6", "23", "64"],
+}
+
+
+class RequestsFetcher:
+    """
+    Default HTTP fetcher: GETs a Gravity Forms REST URL and returns the
+    decoded JSON. Anything with the same call signature can replace it,
+    e.g. to read from a local fixture server in development.
+    """
+
+    def __init__(self, auth=None):
+        self.session = requests.Session()
+        self.session.auth = auth
+
+    def __call__(self, url, params):
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+
+def get_default_fetcher():
+    return RequestsFetcher(auth=(settings.GFORM_KEY, settings.GFORM_SECRET))
+
+
+def fetch_pages(fetcher, url, page_size=PAGE_SIZE, params=None):
+    """
+    Yields (labels, entries) for every page of the form's entries until
+    `total_count` entries have been read.
+    """
+    page = 1
+    seen = 0
+    while True:
+        payload = fetcher(
+            url,
+            dict(
+                params or {},
+                **{
+                    "paging[page_size]": page_size,
+                    "paging[current_page]": page,
+                    "_labels": 1,
+                }
+            ),
+        )
+        entries = payload.get("entries") or []
+        yield payload.get("_labels") or {}, entries
+
+        seen += len(entries)
+        if not entries or seen >= int(payload.get("total_count") or 0):
+            break
+        page += 1
+
+
+class LabelPlan:
+    """
+    Gravity Forms field ids compiled into entry labels.
+
+    `labels` is the `_labels` payload of the entries endpoint: field id to
+    label, or to a {sub-field id: label} dict for composite fields such as
+    names and addresses. `prefixes` maps a label prefix to the field ids it
+    applies to; "1.*" selects all sub-fields of field 1.
+    """
+
+    def __init__(self, labels, prefixes=None):
+        if prefixes is None:
+            prefixes = getattr(settings, "GFORMS_LABEL_PREFIXES", LABEL_PREFIXES)
+
+        field_prefixes = {}
+        subfield_prefixes = {}
+        for prefix, field_ids in prefixes.items():
+            for field_id in field_ids:
+                if field_id.endswith(".*"):
+                    subfield_prefixes.setdefault(field_id[:-2], prefix)
+                else:
+                    field_prefixes.setdefault(field_id, prefix)
+
+        self.plan = {}
+        for field_id, label in labels.items():
+            if not is_field_id(field_id):
+                continue
+
+            if isinstance(label, dict):
+                prefix = subfield_prefixes.get(field_id, "")
+                for key, sublabel in label.items():
+                    self.plan[key] = self.compile_label(prefix, sublabel)
+            else:
+                self.plan[field_id] = self.compile_label(
+                    field_prefixes.get(field_id, ""), label
+                )
+
+    @staticmethod
+    def compile_label(prefix, label):
+        label = (prefix + label).strip(":")
+        return label, "Subcategory" in label
+
+    def translate(self, raw_entry):
+        entry = {}
+        plan = self.plan
+
+        for key, value in raw_entry.items():
+            if not value:
+                continue
+
+            target = plan.get(key)
+            if target is None:
+                if key == "id":
+                    entry["entry_id"] = value
+                continue
+
+            label, is_subcategory = target
+            entry[label] = value
+            if is_subcategory:
+                entry["Subcategory"] = value
+
+        return entry
+
+
+def is_field_id(key):
+    try:
+        float(key)
+    except ValueError:
+        return False
+    return True
+
+
+def get_entry_fields(data, category):
+    return {
+        "title": data.get("Title")
+        or "{} {}".format(data.get("C_First"), data.get("C_Last")),
+        "data": data,
+        "subcategory": data.get("Subcategory", ""),
+        "category": category,
+        "country": (data.get("Country") or "")[:100],
+        "link": data.get("Link") or "",
+        "institution": (data.get("C_Institution") or "")[:255],
+        "nominator_institution": (data.get("N_Institution") or "")[:255],
+    }
+
+
+def parse_date(value):
+    if value:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+def get_delta_params(watermark):
+    """
+    Gravity Forms search parameters for entries changed since `watermark`.
+
+    The API only offers a strict ">" on dates with one second resolution, so
+    the boundary second is fetched again; re-applied entries come out of
+    `sync_entries` unchanged.
+    """
+    params = {"sorting[key]": "date_updated", "sorting[direction]": "ASC"}
+    if watermark.date_updated:
+        since = watermark.date_updated - datetime.timedelta(seconds=1)
+        params["search"] = json.dumps(
+            {
+                "field_filters": [
+                    {
+                        "key": "date_updated",
+                        "operator": ">",
+                        "value": since.strftime(DATE_FORMAT),
+                    }
+                ]
+            }
+        )
+
+    return params
+
+
+def get_categories(names):
+    categories = {category.name: category for category in Category.objects.all()}
+    missing = {name for name in names if name and name not in categories}
+    for category in Category.objects.bulk_create(
+        [Category(name=name) for name in sorted(missing)]
+    ):
+        categories[category.name] = category
+
+    return categories
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.unchanged = 0
+        self.deleted = 0
+
+    def __str__(self):
+        return "{} created, {} updated, {} unchanged, {} deleted".format(
+            len(self.created), len(self.updated), self.unchanged, self.deleted
+        )
+
+
+def sync_entries(entries, prune=False):
+    """
+    Upserts translated entries by `entry_id`.
+
+    Existing rows are updated in place, so ratings attached to them are
+    kept, and only the columns that actually changed are written. With
+    `prune`, entries missing from `entries` are deleted.
+    """
+    result = ImportResult()
+    entries = {int(data["entry_id"]): data for data in entries}
+    changed_fields = set()
+
+    with transaction.atomic():
+        categories = get_categories(
+            data.get("Main Category") for data in entries.values()
+        )
+        existing = {
+            entry.entry_id: entry
+            for entry in Entry.objects.select_related("category").filter(
+                entry_id__in=list(entries)
+            )
+        }
+
+        for entry_id, data in entries.items():
+            fields = get_entry_fields(data, categories.get(data.get("Main Category")))
+
+            entry = existing.get(entry_id)
+            if entry is None:
+                result.created.append(Entry(id=entry_id, entry_id=entry_id, **fields))
+                continue
+
+            changed = [
+                field
+                for field, value in fields.items()
+                if getattr(entry, field) != value
+            ]
+            for field in changed:
+                setattr(entry, field, fields[field])
+
+            if changed:
+                changed_fields.update(changed)
+                result.updated.append(entry)
+            else:
+                result.unchanged += 1
+
+        Entry.objects.bulk_create(result.created, batch_size=500)
+        if result.updated:
+            Entry.objects.bulk_update(
+                result.updated,
+                [field for field in ENTRY_FIELDS if field in changed_fields],
+                batch_size=500,
+            )
+
+        changed_ids = [entry.pk for entry in result.created + result.updated]
+        if changed_ids:
+            transaction.on_commit(lambda: Entry.clear_field_groups(changed_ids))
+            transaction.on_commit(ballots.reset)
+            transaction.on_commit(grids.reset)
+            transaction.on_commit(results.reset)
+
+        if prune:
+            pruned = list(
+                Entry.objects.exclude(entry_id__in=list(entries)).values_list(
+                    "pk", flat=True
+                )
+            )
+            if pruned:
+                # one DELETE per table instead of signals for every row
+                delete_rows(Rating.objects.filter(entry_id__in=pruned))
+                delete_rows(EntryScore.objects.filter(entry_id__in=pruned))
+                result.deleted = delete_rows(Entry.objects.filter(pk__in=pruned))
+                transaction.on_commit(lambda: Entry.clear_field_groups(pruned))
+                transaction.on_commit(counters.reset)
+                transaction.on_commit(ballots.reset)
+                transaction.on_commit(grids.reset)
+                transaction.on_commit(results.reset)
+
+    return result
+
+
+def import_entries(
+    fetcher=None, url=None, page_size=PAGE_SIZE, prune=False, incremental=False
+):
+    """
+    Imports entries from Gravity Forms.
+
+    Every run records the newest `date_updated` it has seen; with
+    `incremental` only entries changed since then are fetched. Deleted
+    entries can't be detected that way, so pruning needs a full import.
+    """
+    fetcher = fetcher or get_default_fetcher()
+    url = url or settings.GFORMS_URL
+    watermark, _ = SyncWatermark.objects.get_or_create(name="entries")
+
+    params = get_delta_params(watermark) if incremental else None
+    date_updated = watermark.date_updated
+
+    entries = []
+    plan = None
+    for labels, page in fetch_pages(fetcher, url, page_size=page_size, params=params):
+        if plan is None:
+            plan = LabelPlan(labels)
+
+        for raw_entry in page:
+            entries.append(plan.translate(raw_entry))
+
+            entry_updated = parse_date(raw_entry.get("date_updated"))
+            if entry_updated and (not date_updated or entry_updated > date_updated):
+                date_updated = entry_updated
+
+    with transaction.atomic():
+        result = sync_entries(entries, prune=prune and not incremental)
+
+        watermark.date_updated = date_updated
+        watermark.save()
+
+    return result
@@ -0,0 +1,46 @@
+"""
+Version stamps for the per-category grids on the assignment page.
+
+Each category's grid of entries and reviewers is cached as an HTML fragment
+keyed on the category's stamp. Rating changes in a category and batch
+assignments `touch()` it; changes that can affect any category (imports,
+init_ratings) call `reset()`, which replaces a stamp shared by all of them.
+"""
+import uuid
+
+from django.core.cache import cache
+
+VERSION_KEY = "grids:version"
+TIMEOUT = 24 * 60 * 60
+
+
+def get_key(category_id):
+    return "grids:category:{}".format(category_id)
+
+
+def new_stamp():
+    return uuid.uuid4().hex
+
+
+def get_version(category_id):
+    key = get_key(category_id)
+    values = cache.get_many([VERSION_KEY, key])
+
+    # a stamp that expired is replaced, so fragments cached under an older
+    # one are never served again
+    for stamp_key in [VERSION_KEY, key]:
+        if stamp_key not in values:
+            cache.add(stamp_key, new_stamp(), None)
+            values[stamp_key] = cache.get(stamp_key)
+
+    return "{}.{}".format(values[VERSION_KEY], values[key])
+
+
+def touch(category_ids):
+    cache.set_many(
+        {get_key(category_id): new_stamp() for category_id in category_ids}, None
+    )
+
+
+def reset():
+    cache.set(VERSION_KEY, new_stamp(), None)
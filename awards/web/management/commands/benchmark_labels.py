@@ -0,0 +1,139 @@
+import random
+import timeit
+
+from django.core.management import BaseCommand, CommandError
+
+from web.gforms import LabelPlan
+
+
+def legacy_translate_entry(raw_entry, labels):
+    # the per-key mapping loop import_entries used before LabelPlan
+    entry = {}
+
+    for key, value in raw_entry.items():
+        if not value:
+            continue
+
+        try:
+            float(key)
+            if "." in key:
+                j, k = key.split(".")
+                label = labels[j][key]
+                if j == "1":
+                    label = "N_" + label
+                if j == "67" or j == "5":
+                    label = "C_" + label
+            else:
+                label = labels[key]
+
+                if key in ["2", "65", "24"]:
+                    label = "N_" + label
+
+                if key in ["6", "23", "64"]:
+                    label = "C_" + label
+
+            label = label.strip(":")
+            entry[label] = value
+
+            if "Subcategory" in label:
+                entry["Subcategory"] = value
+        except ValueError:
+            if key == "id":
+                entry["entry_id"] = value
+
+    return entry
+
+
+def make_payload(entries, seed=0):
+    rng = random.Random(seed)
+
+    labels = {
+        "1": {"1.3": "First", "1.6": "Last"},
+        "5": {"5.3": "First", "5.6": "Last"},
+        "67": {"67.1": "Street", "67.3": "City", "67.6": "Country"},
+        "2": "Email",
+        "65": "Twitter",
+        "24": "Institution",
+        "6": "Email",
+        "23": "Twitter",
+        "64": "Institution",
+        "3": "Title:",
+        "4": "Main Category",
+        "9": "Individual Awards Subcategory",
+        "10": "Open Assets Subcategory",
+    }
+    for field_id in range(11, 60):
+        labels[str(field_id)] = "Question {}:".format(field_id)
+
+    keys = [
+        key
+        for field_id, label in labels.items()
+        for key in (label if isinstance(label, dict) else [field_id])
+    ]
+    meta = ["form_id", "date_created", "date_updated", "ip", "source_url", "status"]
+
+    raw_entries = []
+    for entry_id in range(1, entries + 1):
+        raw_entry = {"id": str(entry_id)}
+        raw_entry.update({key: "meta" for key in meta})
+        raw_entry.update(
+            {
+                key: "value {}".format(rng.random()) if rng.random() > 0.2 else ""
+                for key in keys
+            }
+        )
+        raw_entries.append(raw_entry)
+
+    return labels, raw_entries
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the compiled Gravity Forms label plan against the legacy mapping loop"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--entries",
+            action="store",
+            dest="entries",
+            type=int,
+            default=10000,
+            help="Number of synthetic entries",
+        )
+        parser.add_argument(
+            "--repeat",
+            action="store",
+            dest="repeat",
+            type=int,
+            default=5,
+            help="Timing runs per implementation (best one is reported)",
+        )
+
+    def handle(self, *args, **options):
+        labels, raw_entries = make_payload(options.get("entries"))
+
+        def legacy():
+            return [
+                legacy_translate_entry(raw_entry, labels) for raw_entry in raw_entries
+            ]
+
+        def compiled():
+            plan = LabelPlan(labels)
+            return [plan.translate(raw_entry) for raw_entry in raw_entries]
+
+        if legacy() != compiled():
+            raise CommandError("Compiled label plan doesn't match the legacy mapping")
+
+        repeat = options.get("repeat")
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=repeat))
+        compiled_time = min(timeit.repeat(compiled, number=1, repeat=repeat))
+
+        self.stdout.write(
+            "{} entries: legacy {:.3f}s, compiled {:.3f}s ({:.1f}x faster)".format(
+                len(raw_entries),
+                legacy_time,
+                compiled_time,
+                legacy_time / compiled_time,
+            )
+        )
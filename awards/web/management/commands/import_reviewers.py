@@ -1,7 +1,33 @@
-import xlrd
+import csv
+import os
 
-from django.core.management import BaseCommand
+import xlrd
 from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from web import grids
+from web.models import ReviewerProfile
+
+
+def read_rows(filename):
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == ".csv":
+        with open(filename, newline="", encoding="utf-8-sig") as fp:
+            yield from csv.reader(fp)
+    elif extension in [".xls", ".xlsx"]:
+        sheet = xlrd.open_workbook(filename).sheet_by_index(0)
+        for row_idx in range(sheet.nrows):
+            yield sheet.row_values(row_idx)
+    else:
+        raise CommandError("Unsupported file type: {}".format(extension))
+
+
+def clean(value):
+    return str(value).strip()
 
 
 class Command(BaseCommand):
@@ -9,24 +35,119 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument(
-            "filename", type=str, help="Filename of XLS",
+            "filename", type=str, help="Filename of XLS, XLSX or CSV",
         )
 
     def handle(self, *args, **options):
-        # User.objects.filter(is_staff=False).delete()
-
-        wb = xlrd.open_workbook(options.get("filename"))
-        sheet = wb.sheet_by_index(0)
-
-        for row_idx in range(0, sheet.nrows):
-            first_name = sheet.cell(row_idx, 0).value
-            last_name = sheet.cell(row_idx, 1).value
-            email = sheet.cell(row_idx, 2).value
-
-            User.objects.get_or_create(
-                username=first_name + last_name,
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                is_active=True,
+        reviewers = {}
+        profiles = {}
+        skipped = 0
+        for row in read_rows(options.get("filename")):
+            row = [clean(value) for value in row] + [""] * 5
+            first_name, last_name, email, institution, country = row[:5]
+
+            # header rows and blank lines don't have an e-mail address
+            if "@" not in email:
+                skipped += 1
+                continue
+
+            reviewers[email.lower()] = {
+                "first_name": first_name,
+                "last_name": last_name,
+                "email": email,
+            }
+            profiles[email.lower()] = {"institution": institution, "country": country}
+
+        # usernames are the full name, or the e-mail address if that is taken
+        usernames = {
+            data["first_name"] + data["last_name"] for data in reviewers.values()
+        } | {data["email"] for data in reviewers.values()}
+
+        with transaction.atomic():
+            existing = {}
+            taken_usernames = set()
+            for user in User.objects.annotate(email_lower=Lower("email")).filter(
+                Q(email_lower__in=list(reviewers)) | Q(username__in=usernames)
+            ):
+                existing.setdefault(user.email_lower, user)
+                taken_usernames.add(user.username)
+
+            created = []
+            updated = []
+            for email, data in reviewers.items():
+                user = existing.get(email)
+                if user is None:
+                    username = data["first_name"] + data["last_name"]
+                    if not username or username in taken_usernames:
+                        username = data["email"]
+                    if username in taken_usernames:
+                        raise CommandError(
+                            "Username {} for {} is taken by another user".format(
+                                username, data["email"]
+                            )
+                        )
+                    taken_usernames.add(username)
+
+                    created.append(User(username=username, is_active=True, **data))
+                    continue
+
+                if (
+                    user.first_name != data["first_name"]
+                    or user.last_name != data["last_name"]
+                    or not user.is_active
+                ):
+                    user.first_name = data["first_name"]
+                    user.last_name = data["last_name"]
+                    user.is_active = True
+                    updated.append(user)
+
+            User.objects.bulk_create(created, batch_size=500)
+            User.objects.bulk_update(
+                updated, ["first_name", "last_name", "is_active"], batch_size=500
+            )
+
+            users = {user.email.lower(): user for user in created}
+            users.update(existing)
+            self._update_profiles(users, profiles)
+            transaction.on_commit(grids.reset)
+
+        self.stdout.write(
+            "{} reviewers: {} created, {} updated, {} unchanged ({} rows skipped)".format(
+                len(reviewers),
+                len(created),
+                len(updated),
+                len(reviewers) - len(created) - len(updated),
+                skipped,
             )
+        )
+        for user in created:
+            self.stdout.write("Created {} <{}>".format(user.username, user.email))
+        for user in updated:
+            self.stdout.write("Updated {} <{}>".format(user.username, user.email))
+
+    def _update_profiles(self, users, profiles):
+        existing = ReviewerProfile.objects.in_bulk([user.pk for user in users.values()])
+
+        created = []
+        updated = []
+        for email, data in profiles.items():
+            # files without the optional columns leave profiles alone
+            if not any(data.values()):
+                continue
+
+            user = users[email]
+            profile = existing.get(user.pk)
+            if profile is None:
+                created.append(ReviewerProfile(user=user, **data))
+            elif (profile.institution, profile.country) != (
+                data["institution"],
+                data["country"],
+            ):
+                profile.institution = data["institution"]
+                profile.country = data["country"]
+                updated.append(profile)
+
+        ReviewerProfile.objects.bulk_create(created, batch_size=500)
+        ReviewerProfile.objects.bulk_update(
+            updated, ["institution", "country"], batch_size=500
+        )
@@ -1,10 +1,14 @@
-import random
+from collections import defaultdict
 from math import ceil
 
 from django.contrib.auth.models import User
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 
-from web.models import Entry, Rating
+from web import ballots, counters, grids, results
+from web.affinity import AffinityIndex
+from web.assignment import allocate
+from web.models import Category, Entry, EntryScore, Rating, delete_rows
 
 
 class Command(BaseCommand):
@@ -18,27 +22,81 @@ class Command(BaseCommand):
             "--reviews",
             action="store",
             dest="reviews",
+            type=int,
+            default=3,
             help="Number of reviews per entry",
         )
+        parser.add_argument(
+            "--cap",
+            action="store",
+            dest="cap",
+            type=int,
+            help="Maximum number of ballots per reviewer (default: even split)",
+        )
+        parser.add_argument(
+            "--seed",
+            action="store",
+            dest="seed",
+            type=int,
+            help="Random seed, so a dry run and a commit produce the same assignment",
+        )
+        parser.add_argument(
+            "--exclude",
+            action="append",
+            dest="exclude",
+            default=[],
+            help="Keep a reviewer out of a category, as EMAIL:CATEGORY (repeatable)",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            dest="reset",
+            help="Delete existing ratings (except conflicts) and assign from scratch",
+        )
 
     def handle(self, *args, **options):
         self._create_ratings(
-            commit=options.get("commit"), reviews=int(options.get("reviews"))
+            commit=options.get("commit"),
+            reviews=options.get("reviews"),
+            cap=options.get("cap"),
+            seed=options.get("seed"),
+            exclude=options.get("exclude"),
+            reset=options.get("reset"),
         )
 
-    def _create_ratings(self, commit=False, reviews=3):
+    def _get_excluded_categories(self, exclude, users):
+        users_by_email = {user.email.lower(): user.pk for user in users}
+        categories = dict(Category.objects.values_list("name", "pk"))
+
+        excluded = defaultdict(set)
+        for item in exclude:
+            email, _, category = item.partition(":")
+            if email.lower() not in users_by_email:
+                raise CommandError("Unknown reviewer: {}".format(email))
+            if category not in categories:
+                raise CommandError("Unknown category: {}".format(category))
+            excluded[users_by_email[email.lower()]].add(categories[category])
+
+        return excluded
+
+    def _create_ratings(
+        self, commit=False, reviews=3, cap=None, seed=None, exclude=(), reset=False
+    ):
         if not commit:
             self.stdout.write("===== DRY RUN =====")
         else:
             self.stdout.write("===== Commiting =====")
 
-        users = User.objects.filter(is_staff=False, is_active=True)
-        entries = Entry.objects.all()
-        ballots_per_reviewer = entries.count() * reviews / users.count()
+        users = list(User.objects.filter(is_staff=False, is_active=True))
+        entries = list(Entry.objects.values_list("pk", "category_id"))
+        if not users:
+            raise CommandError("There are no active reviewers in the system")
+
+        ballots_per_reviewer = len(entries) * reviews / len(users)
 
         self.stdout.write(
             "There are {} reviewers in the system and {} entries".format(
-                users.count(), entries.count()
+                len(users), len(entries)
             )
         )
         self.stdout.write(
@@ -47,38 +105,67 @@ class Command(BaseCommand):
             )
         )
 
-        ballots_per_reviewer = ceil(ballots_per_reviewer)
-        users = [u for u in users]
+        if cap is None:
+            cap = ceil(ballots_per_reviewer)
+
+        existing = list(Rating.objects.values_list("entry_id", "user_id", "status"))
+        conflicts = {
+            (entry_id, user_id)
+            for entry_id, user_id, status in existing
+            if status == "conflict"
+        }
+        if reset:
+            existing = [row for row in existing if row[2] == "conflict"]
+
+        affinity = AffinityIndex.build()
+        self.stdout.write(
+            "{} reviewer/entry pairs share an institution or country and are "
+            "skipped".format(len(affinity))
+        )
+
+        allocation = allocate(
+            entries,
+            [user.pk for user in users],
+            reviews,
+            cap,
+            existing=existing,
+            excluded_pairs=conflicts | set(affinity.conflicts),
+            excluded_categories=self._get_excluded_categories(exclude, users),
+            seed=seed,
+        )
+
+        stats = allocation.get_stats([user.pk for user in users])
+        self.stdout.write(
+            "{ballots} new ballots, reviewer load min {min} / max {max} / "
+            "mean {mean} / stdev {stdev} (cap {cap})".format(cap=cap, **stats)
+        )
+        if allocation.shortfalls:
+            self.stdout.write(
+                "{short_entries} entries are missing {short_ballots} ballots; "
+                "raise --cap or add reviewers".format(**stats)
+            )
+            for entry_id, missing in sorted(allocation.shortfalls.items()):
+                self.stdout.write("Entry #{} is short {}".format(entry_id, missing))
 
         if commit:
-            Rating.objects.all().delete()
-
-            for entry in entries:
-                assigned_ballots = 0
-                assigned_users = []
-                while assigned_ballots < reviews:
-                    random_user = random.choice(users)
-                    if random_user in assigned_users:
-                        continue
-
-                    rating = Rating.objects.create(
-                        user=random_user, entry=entry, status="empty"
-                    )
-                    self.stdout.write("{}".format(rating))
-                    assigned_ballots += 1
-                    assigned_users.append(random_user)
-
-                self.stdout.write(
-                    "Entry #{} has {} reviews assigned".format(
-                        entry.entry_id, entry.rating_set.count()
-                    )
+            with transaction.atomic():
+                if reset:
+                    delete_rows(Rating.objects.exclude(status="conflict"))
+
+                Rating.objects.bulk_create(
+                    [
+                        Rating(entry_id=entry_id, user_id=user_id, status="empty")
+                        for entry_id, user_id in allocation.ballots
+                    ],
+                    batch_size=1000,
                 )
 
-                for user in assigned_users:
-                    if user.rating_set.count() >= ballots_per_reviewer:
-                        users.remove(user)
-                        self.stdout.write(
-                            "Removed {} from additional assignments as they already have {}".format(
-                                user.username, ballots_per_reviewer
-                            )
-                        )
+                if reset:
+                    # delete_rows() bypasses Rating.delete() and its signals
+                    EntryScore.refresh()
+
+            counters.reset()
+            ballots.reset()
+            grids.reset()
+            if reset:
+                results.reset()
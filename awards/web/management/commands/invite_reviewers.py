@@ -0,0 +1,62 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from web.models import LoginKey
+from web.outbox import send_queued
+
+
+class Command(BaseCommand):
+    help = "E-mails login links to active reviewers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--commit", action="store_true", dest="commit", help="Send the e-mails",
+        )
+        parser.add_argument(
+            "--email",
+            action="append",
+            dest="emails",
+            default=[],
+            help="Only invite this reviewer (repeatable)",
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            dest="pending",
+            help="Only invite reviewers with ballots left to review",
+        )
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=100,
+            help="Messages sent per batch",
+        )
+        parser.add_argument(
+            "--rate",
+            action="store",
+            dest="rate",
+            type=float,
+            default=20,
+            help="Maximum messages per second",
+        )
+
+    def handle(self, *args, **options):
+        users = LoginKey.get_invitees(options["emails"], options["pending"])
+
+        if not options["commit"]:
+            self.stdout.write("===== DRY RUN =====")
+            for user in users:
+                self.stdout.write("Would invite {} <{}>".format(user, user.email))
+            self.stdout.write("{} reviewers".format(len(users)))
+            return
+
+        with transaction.atomic():
+            keys = LoginKey.invite(users)
+        self.stdout.write("Queued {} invitations".format(len(keys)))
+
+        sent, failed = send_queued(options["batch_size"], options["rate"])
+        self.stdout.write("{} sent, {} failed".format(sent, failed))
+        if failed:
+            self.stdout.write("Failed messages will be retried by send_outbox")
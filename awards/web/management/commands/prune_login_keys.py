@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from web.models import LoginKey
+
+
+class Command(BaseCommand):
+    help = "Deletes used and expired login keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=1000,
+            help="Keys deleted per query",
+        )
+
+    def handle(self, *args, **options):
+        stale = LoginKey.objects.filter(
+            Q(used=True) | Q(pub_date__lt=LoginKey.get_expiry())
+        )
+
+        deleted = 0
+        while True:
+            # short deletes, so logins aren't held up behind one long one
+            pks = list(stale.values_list("pk", flat=True)[: options["batch_size"]])
+            if not pks:
+                break
+            LoginKey.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+
+        self.stdout.write("Deleted {} login keys".format(deleted))
@@ -0,0 +1,106 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+
+from web.assignment import apply_rebalance, plan_rebalance
+from web.models import Category, Entry
+
+
+class Command(BaseCommand):
+    help = "Moves ballots from stalled reviewers and tops up entries short of reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--commit", action="store_true", dest="commit", help="Commit the changes",
+        )
+        parser.add_argument(
+            "--reviews",
+            action="store",
+            dest="reviews",
+            type=int,
+            default=3,
+            help="Number of done reviews each entry should get",
+        )
+        parser.add_argument(
+            "--stale-days",
+            action="store",
+            dest="stale_days",
+            type=int,
+            default=7,
+            help="Reviewers without rating changes for this many days are stalled",
+        )
+        parser.add_argument(
+            "--cap",
+            action="store",
+            dest="cap",
+            type=int,
+            help="Maximum number of open ballots per reviewer",
+        )
+        parser.add_argument(
+            "--category",
+            action="store",
+            dest="category",
+            help="Only rebalance the entries of this category",
+        )
+        parser.add_argument(
+            "--seed",
+            action="store",
+            dest="seed",
+            type=int,
+            help="Random seed, so a dry run and a commit produce the same plan",
+        )
+
+    def handle(self, *args, **options):
+        if not options.get("commit"):
+            self.stdout.write("===== DRY RUN =====")
+        else:
+            self.stdout.write("===== Commiting =====")
+
+        category_id = None
+        if options.get("category"):
+            category = Category.objects.filter(name=options["category"]).first()
+            if category is None:
+                raise CommandError("Unknown category: {}".format(options["category"]))
+            category_id = category.pk
+
+        plan = plan_rebalance(
+            options.get("reviews"),
+            options.get("stale_days"),
+            cap=options.get("cap"),
+            category_id=category_id,
+            seed=options.get("seed"),
+        )
+
+        self.stdout.write(
+            "{moves} ballots to move from stalled reviewers, {additions} to add".format(
+                **plan.get_stats()
+            )
+        )
+        self._report(plan)
+
+        if plan.shortfalls:
+            self.stdout.write(
+                "{short_entries} entries are still missing {short_ballots} "
+                "reviews; raise --cap or add reviewers".format(**plan.get_stats())
+            )
+
+        if options.get("commit"):
+            apply_rebalance(plan)
+
+    def _report(self, plan):
+        entry_ids = dict(Entry.objects.values_list("pk", "entry_id"))
+        emails = dict(User.objects.values_list("pk", "email"))
+
+        for entry_id, from_user, to_user in plan.moves:
+            self.stdout.write(
+                "Entry #{}: {} -> {}".format(
+                    entry_ids[entry_id], emails[from_user], emails[to_user]
+                )
+            )
+        for entry_id, user_id in plan.additions:
+            self.stdout.write(
+                "Entry #{}: + {}".format(entry_ids[entry_id], emails[user_id])
+            )
+        for entry_id, missing in sorted(plan.shortfalls.items()):
+            self.stdout.write(
+                "Entry #{} is short {}".format(entry_ids[entry_id], missing)
+            )
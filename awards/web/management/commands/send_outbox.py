@@ -0,0 +1,49 @@
+import time
+
+from django.core.management import BaseCommand
+
+from web.outbox import send_queued
+
+
+class Command(BaseCommand):
+    help = "Sends queued e-mails"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            action="store",
+            dest="batch_size",
+            type=int,
+            default=50,
+            help="Messages claimed at a time",
+        )
+        parser.add_argument(
+            "--rate",
+            action="store",
+            dest="rate",
+            type=float,
+            help="Maximum messages per second",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            dest="loop",
+            help="Keep running and poll for new messages",
+        )
+        parser.add_argument(
+            "--interval",
+            action="store",
+            dest="interval",
+            type=float,
+            default=2,
+            help="Seconds to wait between polls with --loop",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued(options["batch_size"], options["rate"])
+            if sent or failed or not options["loop"]:
+                self.stdout.write("{} sent, {} failed".format(sent, failed))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from web.models import EntryScore, Rating
+
+
+class Command(BaseCommand):
+    help = "Recomputes stored rating averages and entry scores"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ratings = []
+            for rating in Rating.objects.select_for_update().iterator():
+                average = rating.compute_average()
+                if rating.average != average:
+                    rating.average = average
+                    ratings.append(rating)
+
+            Rating.objects.bulk_update(ratings, ["average"], batch_size=1000)
+            EntryScore.refresh()
+
+        self.stdout.write(
+            "Updated {} rating averages and {} entry scores".format(
+                len(ratings), EntryScore.objects.count()
+            )
+        )
@@ -0,0 +1,128 @@
+"""
+Opt-in request profiling.
+
+Set PROFILING_SAMPLE_RATE (0 to 1) to record a share of requests: for each
+sampled request the view name, total time, number of queries, repeated
+queries and the slowest query are logged to the "web.profiling" logger.
+With PROFILING_SERVER_TIMING the timings are also sent in a Server-Timing
+header. Queries run while a streaming response is being sent aren't counted.
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger("web.profiling")
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r"\b\d+(\.\d+)?\b")
+LISTS = re.compile(r"\(\s*\?(\s*,\s*\?)*\s*\)")
+
+
+def get_fingerprint(sql):
+    """
+    Normalizes literals out of `sql`, so the same query with different
+    parameters (the signature of an N+1) gets the same fingerprint.
+    """
+    sql = STRINGS.sub("?", sql)
+    sql = NUMBERS.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    return LISTS.sub("(...)", sql)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def duration(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def get_duplicates(self):
+        fingerprints = Counter(get_fingerprint(sql) for sql, duration in self.queries)
+        return [
+            (fingerprint, count)
+            for fingerprint, count in fingerprints.most_common()
+            if count > 1
+        ]
+
+    def get_slowest(self):
+        if self.queries:
+            return max(self.queries, key=lambda query: query[1])
+
+
+class ProfilingMiddleware:
+    # how many repeated fingerprints to log per request
+    max_duplicates = 5
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0)
+        self.server_timing = getattr(settings, "PROFILING_SERVER_TIMING", False)
+
+        if not self.sample_rate:
+            raise MiddlewareNotUsed()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        self.log(request, response, duration, recorder)
+        if self.server_timing:
+            timing = 'app;dur={:.1f}, db;dur={:.1f};desc="{} queries"'
+            response["Server-Timing"] = timing.format(
+                duration * 1000, recorder.duration * 1000, len(recorder.queries)
+            )
+
+        return response
+
+    def log(self, request, response, duration, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        duplicates = recorder.get_duplicates()
+        slowest = recorder.get_slowest()
+
+        logger.info(
+            "view=%s method=%s status=%s time_ms=%.1f queries=%d db_ms=%.1f "
+            "duplicates=%d",
+            view,
+            request.method,
+            response.status_code,
+            duration * 1000,
+            len(recorder.queries),
+            recorder.duration * 1000,
+            sum(count for fingerprint, count in duplicates),
+            extra={
+                "view": view,
+                "time_ms": duration * 1000,
+                "queries": len(recorder.queries),
+                "db_ms": recorder.duration * 1000,
+            },
+        )
+        for fingerprint, count in duplicates[: self.max_duplicates]:
+            logger.info("view=%s duplicate=%d sql=%s", view, count, fingerprint)
+        if slowest:
+            logger.info(
+                "view=%s slowest_ms=%.1f sql=%s", view, slowest[1] * 1000, slowest[0]
+            )
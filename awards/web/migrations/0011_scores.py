@@ -0,0 +1,90 @@
+# Generated by Django 3.0.8 on 2026-10-18 08:45
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+CRITERIA = [
+    "access",
+    "quality",
+    "visual",
+    "engagement",
+    "inclusion",
+    "licensing",
+    "accessibility",
+    "currency",
+]
+
+
+def fill_scores(apps, schema_editor):
+    # historical models have no `Rating.compute_average` or
+    # `EntryScore.refresh`, so both are repeated here
+    Entry = apps.get_model("web", "Entry")
+    EntryScore = apps.get_model("web", "EntryScore")
+    Rating = apps.get_model("web", "Rating")
+
+    ratings = list(Rating.objects.only("pk", *CRITERIA))
+    for rating in ratings:
+        scores = [getattr(rating, name) for name in CRITERIA]
+        scores = [score for score in scores if score]
+        rating.average = round(sum(scores) / len(scores), 2) if scores else None
+    Rating.objects.bulk_update(ratings, ["average"], batch_size=500)
+
+    score = Coalesce("individual", "average", output_field=models.FloatField())
+    aggregates = {
+        row.pop("entry_id"): row
+        for row in Rating.objects.filter(status="done")
+        .values("entry_id")
+        .order_by()
+        .annotate(
+            count=models.Count("pk"),
+            mean=models.Avg(score),
+            minimum=models.Min(score),
+            maximum=models.Max(score),
+            stddev=models.StdDev(score),
+        )
+    }
+    EntryScore.objects.bulk_create(
+        [
+            EntryScore(entry_id=entry_id, **aggregates.get(entry_id, {}))
+            for entry_id in Entry.objects.values_list("pk", flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("web", "0010_syncwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EntryScore",
+            fields=[
+                (
+                    "entry",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="score",
+                        serialize=False,
+                        to="web.Entry",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0)),
+                ("mean", models.FloatField(db_index=True, null=True)),
+                ("minimum", models.FloatField(null=True)),
+                ("maximum", models.FloatField(null=True)),
+                ("stddev", models.FloatField(null=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="rating",
+            name="average",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.0.8 on 2026-10-18 08:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+STATUS_ORDER = ["done", "conflict", "draft", "empty"]
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    # keep the most complete (then most recently updated) rating per pair
+    Rating = apps.get_model("web", "Rating")
+
+    seen = set()
+    duplicates = []
+    ratings = Rating.objects.order_by("entry_id", "user_id", "-updated").values_list(
+        "pk", "entry_id", "user_id", "status"
+    )
+    for pk, entry_id, user_id, status in sorted(
+        ratings, key=lambda row: (row[1], row[2], STATUS_ORDER.index(row[3]))
+    ):
+        if (entry_id, user_id) in seen:
+            duplicates.append(pk)
+        seen.add((entry_id, user_id))
+
+    Rating.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("web", "0011_scores"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(
+                fields=["user", "status"], name="web_rating_user_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(
+                fields=["entry", "status"], name="web_rating_entry_status_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="rating",
+            constraint=models.UniqueConstraint(
+                fields=("entry", "user"), name="web_rating_unique_entry_user"
+            ),
+        ),
+        # the composite indexes above lead with these columns
+        migrations.AlterField(
+            model_name="rating",
+            name="entry",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="web.Entry",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rating",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_keys(apps, schema_editor):
+    # links already sent keep working: the check hashes the key in the URL
+    LoginKey = apps.get_model("web", "LoginKey")
+
+    keys = list(LoginKey.objects.only("pk", "key"))
+    for login_key in keys:
+        login_key.key = hashlib.sha256(login_key.key.encode()).hexdigest()
+    LoginKey.objects.bulk_update(keys, ["key"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("web", "0013_outboxemail"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="loginkey", name="key", field=models.CharField(max_length=64),
+        ),
+        migrations.RunPython(hash_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="loginkey",
+            name="key",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="loginkey",
+            name="pub_date",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+def copy_list_fields(apps, schema_editor):
+    Entry = apps.get_model("web", "Entry")
+
+    entries = list(Entry.objects.only("pk", "data"))
+    for entry in entries:
+        data = entry.data or {}
+        entry.country = (data.get("Country") or "")[:100]
+        entry.link = data.get("Link") or ""
+        entry.institution = (data.get("C_Institution") or "")[:255]
+    Entry.objects.bulk_update(
+        entries, ["country", "link", "institution"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("web", "0014_hashed_login_keys"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entry",
+            name="country",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="institution",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="entry", name="link", field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(copy_list_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_nominator_institution(apps, schema_editor):
+    Entry = apps.get_model("web", "Entry")
+
+    entries = list(Entry.objects.only("pk", "data"))
+    for entry in entries:
+        data = entry.data or {}
+        entry.nominator_institution = (data.get("N_Institution") or "")[:255]
+    Entry.objects.bulk_update(entries, ["nominator_institution"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0011_update_proxy_permissions"),
+        ("web", "0015_entry_list_columns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewerProfile",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="profile",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("institution", models.CharField(blank=True, max_length=255)),
+                ("country", models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="entry",
+            name="nominator_institution",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(copy_nominator_institution, migrations.RunPython.noop),
+    ]
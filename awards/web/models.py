@@ -1,12 +1,18 @@
+import datetime
+import hashlib
 import statistics
 import uuid
+from collections import Counter
 
-from django.core.mail import send_mail
-from django.db import models
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.postgres.fields import JSONField
 from django.contrib.auth.models import User
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.urls import reverse_lazy, reverse
+from django.utils import timezone
+from django.utils.safestring import mark_safe
 
 
 class Category(models.Model):
@@ -20,6 +26,25 @@ class Category(models.Model):
         return self.name
 
 
+# entries only change on import, which clears their groups explicitly
+FIELD_GROUPS_TIMEOUT = 24 * 60 * 60
+
+
+class EntryQuerySet(models.QuerySet):
+    def with_status_counts(self):
+        return self.annotate(
+            num_dones=models.Count(
+                "rating", filter=models.Q(rating__status__in=["done"])
+            ),
+            num_conflicts=models.Count(
+                "rating", filter=models.Q(rating__status__in=["conflict"])
+            ),
+            num_drafts=models.Count(
+                "rating", filter=models.Q(rating__status__in=["empty", "draft"])
+            ),
+        )
+
+
 class Entry(models.Model):
     title = models.TextField()
     entry_id = models.IntegerField(null=True)
@@ -29,12 +54,20 @@ class Entry(models.Model):
     )
     subcategory = models.CharField(max_length=125, blank=True)
 
+    # copied from `data` on import, so list pages can defer it
+    country = models.CharField(max_length=100, blank=True)
+    link = models.TextField(blank=True)
+    institution = models.CharField(max_length=255, blank=True)
+    nominator_institution = models.CharField(max_length=255, blank=True)
+
     material = models.TextField(blank=True, null=True)
     video = models.TextField(blank=True, null=True)
     slideshare = models.TextField(blank=True, null=True)
 
     data = JSONField(blank=True, null=True)
 
+    objects = EntryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Entry"
         verbose_name_plural = "Entries"
@@ -42,34 +75,160 @@ class Entry(models.Model):
     def __str__(self):
         return "#{} - {}".format(self.entry_id, self.title)
 
+    # reviewer names are listed with the ratings
     def conflicts(self):
-        return self.rating_set(manager="conflicts")
+        return self.rating_set(manager="conflicts").select_related("user")
 
     def dones(self):
-        return self.rating_set(manager="dones")
+        return self.rating_set(manager="dones").select_related("user")
 
     def drafts(self):
-        return self.rating_set(manager="drafts")
+        return self.rating_set(manager="drafts").select_related("user")
 
-    def get_reviewers(self):
-        reviewers = []
-        for user in User.objects.filter(is_staff=False).order_by("first_name"):
-            reviewers.append(
-                {
-                    "user": user,
-                    "assigned": self.rating_set.filter(
-                        user=user, status__in=["empty", "draft", "conflict"]
-                    ).exists(),
-                }
-            )
-        return reviewers
+    def get_reviewers(self, matrix=None):
+        if matrix is None:
+            matrix = AssignmentMatrix(entry_id=self.pk)
+        return matrix.get_reviewers(self)
 
     def get_entry_link(self):
-        return self.data.get("Link")
+        return self.link
 
     def get_absolute_url(self):
         return reverse("entry-detail", kwargs={"pk": self.pk})
 
+    @staticmethod
+    def get_field_groups_key(pk, is_staff):
+        return "entry:{}:field-groups:{}".format(
+            pk, "staff" if is_staff else "reviewer"
+        )
+
+    @classmethod
+    def clear_field_groups(cls, pks):
+        cache.delete_many(
+            [
+                cls.get_field_groups_key(pk, is_staff)
+                for pk in pks
+                for is_staff in [True, False]
+            ]
+        )
+
+    def get_field_groups(self, is_staff=False):
+        """
+        Field groups shown on the entry page, cached per entry and visibility
+        until the entry is changed.
+        """
+        key = self.get_field_groups_key(self.pk, is_staff)
+        groups = cache.get(key)
+        if groups is None:
+            groups = self.build_field_groups(is_staff)
+            cache.set(key, groups, FIELD_GROUPS_TIMEOUT)
+        return groups
+
+    def build_field_groups(self, is_staff=False):
+        data = self.data
+
+        materials = []
+        for material in data.get("Additional Support Material (optional)", []):
+            if material:
+                materials.append(
+                    '<a href="{}" target="_blank">{}</a><br /><br />'.format(
+                        material, material.split("/")[-1]
+                    )
+                )
+        materials = mark_safe("\n".join(materials))
+
+        letters = []
+        for letter in data.get("Letter of Support (required if self-nominating)", []):
+            if letter:
+                letters.append(
+                    '<a href="{}" target="_blank">{}</a><br /><br />'.format(
+                        letter, letter.split("/")[-1]
+                    )
+                )
+        letters = mark_safe("\n".join(letters))
+
+        nominee_fields = {}
+        if is_staff:
+            nominee_fields = {
+                "Name": "{} {}".format(data.get("C_First"), data.get("C_Last")),
+                "Email": data.get("C_Email"),
+                "Twitter": data.get("C_Twitter"),
+            }
+
+        groups = [
+            {
+                "name": "Nominee's Information",
+                "fields": dict(
+                    {
+                        "Title": data.get("Title"),
+                        "Link": data.get("Link"),
+                        "License": data.get("License"),
+                        "Description": data.get("Description")
+                        or data.get("Description (optional)"),
+                        "Institution": data.get("C_Institution"),
+                        "Location": "{}, {}".format(
+                            data.get("City"), data.get("Country")
+                        ),
+                    },
+                    **nominee_fields
+                ),
+            },
+        ]
+
+        if (
+            data.get("Proposed Citation")
+            or data.get("Background")
+            or data.get("Link to Youtube video (optional, but encouraged)")
+            or letters
+            or materials
+            or data.get("Link to Slideshare presentation (optional)")
+        ):
+            groups.append(
+                {
+                    "name": "Supporting materials",
+                    "fields": {
+                        "Proposed Citation": data.get("Proposed Citation"),
+                        "Background": data.get("Background"),
+                        "Youtube video": data.get(
+                            "Link to Youtube video (optional, but encouraged)"
+                        ),
+                        "Letter of Support": letters,
+                        "Additional Support Material": materials,
+                        "Slideshare presentation": data.get(
+                            "Link to Slideshare presentation (optional)"
+                        ),
+                    },
+                },
+            )
+
+        if is_staff or self.category.name not in [
+            "Open Assets Awards",
+            "Open Practices Awards",
+        ]:
+            nominator_ppi = {}
+            if is_staff:
+                nominator_ppi = {
+                    "Email": data.get("N_Email"),
+                    "Twitter": data.get("N_Twitter"),
+                }
+
+            groups.append(
+                {
+                    "name": "Nominator's Information",
+                    "fields": dict(
+                        {
+                            "Name": "{} {}".format(
+                                data.get("N_First"), data.get("N_Last")
+                            ),
+                            "Institution": data.get("N_Institution"),
+                        },
+                        **nominator_ppi
+                    ),
+                },
+            )
+
+        return groups
+
 
 RATING_CHOICES = (
     ("empty", "Empty ballot"),
@@ -79,6 +238,24 @@ RATING_CHOICES = (
 )
 
 
+def score_average(scores):
+    # unanswered criteria and "N/A" (stored as 0) don't count towards the average
+    scores = [score for score in scores if score]
+    if scores:
+        return round(statistics.mean(scores), 2)
+
+
+def delete_rows(queryset):
+    """
+    Deletes the rows of `queryset` with one DELETE and returns how many went.
+
+    Unlike `QuerySet.delete()` the rows aren't loaded and no signals are sent,
+    so callers reset the caches the signal receivers would have updated.
+    Nothing cascades either: delete the rows that refer to these first.
+    """
+    return queryset._raw_delete(queryset.db)
+
+
 class DraftsRatingManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(status__in=["empty", "draft"])
@@ -95,8 +272,9 @@ class ConflictsRatingManager(models.Manager):
 
 
 class Rating(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    entry = models.ForeignKey(Entry, on_delete=models.CASCADE)
+    # both are covered by the composite indexes in Meta
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE, db_index=False)
 
     access = models.IntegerField(
         null=True,
@@ -139,6 +317,7 @@ class Rating(models.Model):
         help_text="Information is current and up to date. Date of materials is clearly indicated.",
     )
     individual = models.IntegerField(null=True, verbose_name="Individual Rating")
+    average = models.FloatField(null=True, editable=False)
 
     comment = models.TextField(blank=True, verbose_name="Comment (optional)")
 
@@ -151,56 +330,358 @@ class Rating(models.Model):
     dones = DonesRatingManager()
     conflicts = ConflictsRatingManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="web_rating_user_status_idx"),
+            models.Index(
+                fields=["entry", "status"], name="web_rating_entry_status_idx"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["entry", "user"], name="web_rating_unique_entry_user"
+            ),
+        ]
+
     def __str__(self):
         return "Rating of #{} by {}".format(self.entry.entry_id, self.user.username)
 
-    @property
-    def average(self):
-        scores = []
-        for item in [
-            self.access,
-            self.quality,
-            self.visual,
-            self.engagement,
-            self.inclusion,
-            self.licensing,
-            self.accessibility,
-            self.currency,
-        ]:
-            if item:
-                scores.append(item)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def compute_average(self):
+        return score_average(
+            [
+                self.access,
+                self.quality,
+                self.visual,
+                self.engagement,
+                self.inclusion,
+                self.licensing,
+                self.accessibility,
+                self.currency,
+            ]
+        )
+
+    def save(self, *args, **kwargs):
+        self.average = self.compute_average()
+        super().save(*args, **kwargs)
+
+        if "done" in [self._loaded_status, self.status]:
+            EntryScore.refresh([self.entry_id])
+        self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        if self._loaded_status == "done":
+            EntryScore.refresh([self.entry_id])
+        return result
+
+
+class EntryScore(models.Model):
+    """
+    Aggregate of an entry's completed ratings, kept in step with `Rating`
+    so results can be ranked and filtered in SQL.
+
+    The score of a rating is its `individual` rating for Individual Awards
+    and the average of its criteria for everything else.
+    """
+
+    entry = models.OneToOneField(
+        Entry, primary_key=True, related_name="score", on_delete=models.CASCADE
+    )
+    count = models.IntegerField(default=0)
+    mean = models.FloatField(null=True, db_index=True)
+    minimum = models.FloatField(null=True)
+    maximum = models.FloatField(null=True)
+    stddev = models.FloatField(null=True)
+
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "Score of #{}: {}".format(self.entry_id, self.mean)
+
+    @staticmethod
+    def get_aggregates():
+        score = Coalesce("individual", "average", output_field=models.FloatField())
+        return {
+            "count": models.Count("pk"),
+            "mean": models.Avg(score),
+            "minimum": models.Min(score),
+            "maximum": models.Max(score),
+            "stddev": models.StdDev(score),
+        }
+
+    @classmethod
+    def refresh(cls, entry_ids=None):
+        """
+        Recomputes the scores of `entry_ids` (or of all entries) with one
+        grouped query over their completed ratings.
+
+        Rows are upserted rather than deleted and re-created, so concurrent
+        refreshes of the same entry can't collide on the primary key.
+        """
+        ratings = Rating.dones.all()
+        entries = Entry.objects.all()
+        if entry_ids is not None:
+            ratings = ratings.filter(entry_id__in=entry_ids)
+            entries = entries.filter(pk__in=entry_ids)
+
+        aggregates = {
+            row.pop("entry_id"): row
+            for row in ratings.values("entry_id")
+            .order_by()
+            .annotate(**cls.get_aggregates())
+        }
+        # entries without done ratings are reset, not left with stale values
+        empty = dict(count=0, mean=None, minimum=None, maximum=None, stddev=None)
+        now = timezone.now()
+        scores = [
+            cls(entry_id=entry_id, updated=now, **aggregates.get(entry_id, empty))
+            for entry_id in entries.values_list("pk", flat=True)
+        ]
+
+        fields = ["count", "mean", "minimum", "maximum", "stddev", "updated"]
+        with transaction.atomic():
+            cls.objects.bulk_create(scores, batch_size=1000, ignore_conflicts=True)
+            cls.objects.bulk_update(scores, fields, batch_size=1000)
+
+
+class AssignmentMatrix:
+    """
+    Snapshot of which reviewer holds a ballot for which entry.
+
+    Built from a single pass over `Rating`, so pages listing many entries
+    with their reviewers don't have to query per (entry, user) pair. Pass an
+    `affinity.AffinityIndex` to flag predictable conflicts. Reviewer loads
+    are only counted when all ratings are read.
+    """
+
+    assigned_statuses = ["empty", "draft", "conflict"]
+
+    def __init__(self, category_id=None, entry_id=None, affinity=None):
+        self.affinity = affinity
+        self.reviewers = list(
+            User.objects.filter(is_staff=False).order_by("first_name")
+        )
+        self.statuses = {}
+        self.loads = Counter()
+
+        ratings = Rating.objects.all()
+        if category_id is not None:
+            ratings = ratings.filter(entry__category_id=category_id)
+        if entry_id is not None:
+            ratings = ratings.filter(entry_id=entry_id)
+        if category_id is not None or entry_id is not None:
+            # loads would only count the filtered ballots
+            self.loads = None
+
+        for entry_id, user_id, status in ratings.values_list(
+            "entry_id", "user_id", "status"
+        ):
+            self.statuses[(entry_id, user_id)] = status
+            if self.loads is not None:
+                self.loads[user_id] += 1
+
+    def get_status(self, entry, user):
+        return self.statuses.get((entry.pk, user.pk))
+
+    def is_assigned(self, entry, user):
+        return self.get_status(entry, user) in self.assigned_statuses
+
+    def get_conflict(self, entry, user):
+        if self.affinity is not None:
+            return self.affinity.get_conflict(entry.pk, user.pk)
+
+    def get_reviewers(self, entry):
+        return [
+            {
+                "user": user,
+                "assigned": self.is_assigned(entry, user),
+                "load": self.loads[user.pk] if self.loads is not None else None,
+                "conflict": self.get_conflict(entry, user),
+            }
+            for user in self.reviewers
+        ]
+
+
+class SyncWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    date_updated = models.DateTimeField(null=True, blank=True)
+
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} @ {}".format(self.name, self.date_updated)
+
+
+class ReviewerProfile(models.Model):
+    """
+    Reviewer details used to predict conflicts of interest, see `affinity`.
+    """
+
+    user = models.OneToOneField(
+        User, primary_key=True, related_name="profile", on_delete=models.CASCADE
+    )
+    institution = models.CharField(max_length=255, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return "Profile of {}".format(self.user.username)
+
+
+LOGIN_KEY_MAX_AGE = datetime.timedelta(days=7)
 
-        if scores:
-            return round(statistics.mean(scores), 2)
+
+def hash_login_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
 
 
 class LoginKey(models.Model):
+    """
+    Single-use login link. Only a hash of the key is stored, the key itself
+    is in `raw_key` until the instance that created it is gone.
+    """
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     email = models.EmailField()
-    key = models.CharField(max_length=32)
+    key = models.CharField(max_length=64, unique=True)
 
     used = models.BooleanField(default=False)
-    pub_date = models.DateTimeField(auto_now_add=True)
+    pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    raw_key = None
 
     def __str__(self):
         return "{} - {}".format(self.user, self.email)
 
+    def set_key(self):
+        self.raw_key = uuid.uuid4().hex
+        self.key = hash_login_key(self.raw_key)
+
     def save(self, *args, **kwargs):
         if not self.key:
-            self.key = uuid.uuid4().hex
+            self.set_key()
 
         super(LoginKey, self).save(*args, **kwargs)
 
-    def send_email(self):
-        body = render_to_string(
-            "mail-login/mail_body.txt", {"url": self.get_absolute_url()}
+    @classmethod
+    def get_expiry(cls):
+        return timezone.now() - LOGIN_KEY_MAX_AGE
+
+    @classmethod
+    def use(cls, raw_key):
+        """
+        Marks the key as used and returns the id of its user, or None if the
+        key is unknown, used or expired; one UPDATE on the unique key index.
+        """
+        # the ORM can't return rows from an UPDATE
+        sql = (
+            "UPDATE {} SET used = %s "
+            "WHERE key = %s AND used = %s AND pub_date >= %s "
+            "RETURNING user_id"
+        ).format(connection.ops.quote_name(cls._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql, [True, hash_login_key(raw_key), False, cls.get_expiry()]
+            )
+            row = cursor.fetchone()
+
+        return row[0] if row else None
+
+    def get_email(self, template=None):
+        if template is None:
+            template = get_template("mail-login/mail_body.txt")
+
+        return OutboxEmail(
+            subject="OE Awards Review login information",
+            body=template.render({"url": self.get_absolute_url()}),
+            from_email="memberservices@oeglobal.org",
+            to=self.email,
         )
-        send_mail(
-            "OE Awards Review login information",
-            body,
-            "memberservices@oeglobal.org",
-            [self.email],
+
+    def send_email(self):
+        self.get_email().save()
+
+    @staticmethod
+    def get_invitees(emails=(), pending=False):
+        """
+        Active reviewers with an e-mail address, optionally only those in
+        `emails` or with ballots left to review.
+        """
+        users = User.objects.filter(is_staff=False, is_active=True).exclude(email="")
+        if emails:
+            users = users.annotate(email_lower=Lower("email")).filter(
+                email_lower__in=[email.lower() for email in emails]
+            )
+        if pending:
+            users = users.filter(rating__status__in=["empty", "draft"]).distinct()
+        return list(users.order_by("first_name", "last_name"))
+
+    @classmethod
+    def invite(cls, users):
+        """
+        Creates login keys for `users` and queues their login e-mails, with a
+        query each for all keys and all e-mails.
+        """
+        keys = [cls(user=user, email=user.email) for user in users if user.email]
+        for key in keys:
+            key.set_key()
+        cls.objects.bulk_create(keys, batch_size=500)
+
+        template = get_template("mail-login/mail_body.txt")
+        OutboxEmail.objects.bulk_create(
+            [key.get_email(template) for key in keys], batch_size=500
         )
+        return keys
 
     def get_absolute_url(self):
-        return reverse_lazy("login-key-check", kwargs={"key": self.key})
+        return reverse_lazy("login-key-check", kwargs={"key": self.raw_key})
+
+
+OUTBOX_STATUS_CHOICES = (
+    ("queued", "Queued"),
+    ("sending", "Sending"),
+    ("sent", "Sent"),
+    ("failed", "Failed"),
+)
+
+
+class OutboxEmail(models.Model):
+    """
+    E-mail waiting to be sent by the `send_outbox` worker.
+    """
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.EmailField()
+
+    status = models.CharField(
+        max_length=10, choices=OUTBOX_STATUS_CHOICES, default="queued"
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox e-mail"
+        verbose_name_plural = "Outbox e-mails"
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt"], name="web_outbox_status_next_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return "{} to {}".format(self.subject, self.to)
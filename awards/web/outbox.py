@@ -0,0 +1,165 @@
+"""
+Sending queued `OutboxEmail`s.
+
+Workers claim due messages with SELECT ... FOR UPDATE SKIP LOCKED and mark
+them "sending" in a short transaction, so several can run at once without
+sending a message twice and no row stays locked while the mail server
+answers. A batch is then sent over one SMTP connection and the results are
+saved in a second transaction. Messages whose worker stopped mid-batch are
+claimed again once their lease runs out. Failed messages are retried with
+exponential backoff until MAX_ATTEMPTS.
+"""
+import datetime
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = 6
+BACKOFF = datetime.timedelta(minutes=1)
+MAX_BACKOFF = datetime.timedelta(hours=1)
+# how long a claimed message is left to its worker before others retry it
+SENDING_LEASE = datetime.timedelta(minutes=10)
+
+
+def get_backoff(attempts):
+    return min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def mark_failed(email, error, now):
+    email.last_error = "{}: {}".format(type(error).__name__, error)
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = "failed"
+    else:
+        email.status = "queued"
+        email.next_attempt = now + get_backoff(email.attempts)
+
+
+def claim_batch(batch_size, now):
+    """
+    Marks up to `batch_size` due messages as "sending" and returns them.
+
+    Each claim counts as an attempt, so a message that stops its worker
+    every time still ends up failed.
+    """
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=["queued", "sending"], next_attempt__lte=now)
+            .order_by("next_attempt", "pk")[:batch_size]
+        )
+
+        claimed = []
+        for email in emails:
+            if email.attempts >= MAX_ATTEMPTS:
+                email.status = "failed"
+                continue
+            email.status = "sending"
+            email.attempts += 1
+            email.next_attempt = now + SENDING_LEASE
+            claimed.append(email)
+
+        OutboxEmail.objects.bulk_update(emails, ["status", "attempts", "next_attempt"])
+
+    return claimed
+
+
+class RateLimiter:
+    """
+    Spaces out calls to `wait()` to at most `rate` per second.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = 0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_call:
+            time.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+
+def send_batch(batch_size=50, connection=None, limiter=None):
+    """
+    Sends up to `batch_size` due messages; returns the number sent and the
+    number that failed.
+
+    Pass an open `connection` to reuse it across batches and a RateLimiter
+    to stay under the mail server's sending limits.
+    """
+    now = timezone.now()
+    sent = failed = 0
+
+    emails = claim_batch(batch_size, now)
+    if not emails:
+        return sent, failed
+
+    own_connection = connection is None
+    if own_connection:
+        connection = get_connection()
+
+    try:
+        connection.open()
+    except Exception as error:
+        for email in emails:
+            mark_failed(email, error, now)
+        failed = len(emails)
+    else:
+        for email in emails:
+            if limiter:
+                limiter.wait()
+
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                [email.to],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as error:
+                mark_failed(email, error, now)
+                failed += 1
+            else:
+                email.status = "sent"
+                email.sent = timezone.now()
+                sent += 1
+
+        if own_connection:
+            connection.close()
+
+    with transaction.atomic():
+        OutboxEmail.objects.bulk_update(
+            emails, ["status", "next_attempt", "last_error", "sent"]
+        )
+
+    return sent, failed
+
+
+def send_queued(batch_size=50, rate=None):
+    """
+    Sends due messages in batches over one SMTP connection, at most `rate`
+    per second; returns the number sent and the number that failed.
+    """
+    limiter = RateLimiter(rate)
+    connection = get_connection()
+    total_sent = total_failed = 0
+
+    try:
+        while True:
+            sent, failed = send_batch(batch_size, connection, limiter)
+            total_sent += sent
+            total_failed += failed
+            # stop on a short batch, or when nothing goes through at all
+            if sent + failed < batch_size or not sent:
+                break
+    finally:
+        connection.close()
+
+    return total_sent, total_failed
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Q
+from django.db.models.functions import Cast, NullIf
+
+WORKLOAD_ORDERING = {
+    "name": ["first_name", "last_name"],
+    "dones": ["dones"],
+    "drafts": ["drafts"],
+    "conflicts": ["conflicts"],
+    "total": ["total"],
+    "completion": ["completion"],
+    "last_activity": ["last_activity"],
+}
+
+
+def get_reviewer_workload(sort="name", min_completion=None, max_completion=None):
+    """
+    Active reviewers annotated with their ballot counts by status, the
+    share of ballots they finished (done or skipped) and the time of their
+    last rating change, all from one grouped query over `Rating`.
+
+    `sort` is a key of WORKLOAD_ORDERING, optionally prefixed with "-".
+    """
+    descending = sort.startswith("-")
+    fields = WORKLOAD_ORDERING.get(sort.lstrip("-"), WORKLOAD_ORDERING["name"])
+    ordering = [
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field in fields
+    ]
+
+    queryset = (
+        User.objects.filter(is_active=True, is_superuser=False)
+        .annotate(
+            dones=Count("rating", filter=Q(rating__status__in=["done"])),
+            conflicts=Count("rating", filter=Q(rating__status__in=["conflict"])),
+            drafts=Count("rating", filter=Q(rating__status__in=["empty", "draft"])),
+            total=Count("rating"),
+            last_activity=Max("rating__updated"),
+        )
+        .annotate(
+            completion=ExpressionWrapper(
+                Cast(F("dones") + F("conflicts"), FloatField()) / NullIf(F("total"), 0),
+                output_field=FloatField(),
+            )
+        )
+        .order_by(*ordering)
+    )
+
+    if min_completion is not None:
+        queryset = queryset.filter(completion__gte=min_completion)
+    if max_completion is not None:
+        queryset = queryset.filter(completion__lte=max_completion)
+
+    return queryset
@@ -0,0 +1,183 @@
+"""
+Ranked results with reviewer bias taken out.
+
+Every done rating's score (`individual`, or the criteria average) is
+normalized against its reviewer's other ratings in the same category: the
+reviewer's mean is subtracted and the difference divided by their standard
+deviation, then mapped back onto the category's scale. Reviewers with fewer
+than `MIN_RATINGS` ratings in the category keep their raw scores, since their
+mean says nothing about their bias; those who gave the same score every time
+are only mean-centred.
+Entries are ranked by their mean normalized score, with a 95% confidence
+interval, per category and per subcategory.
+
+All done ratings are read with one query into NumPy arrays and each
+category is computed in one vectorized pass. Results are cached until a
+done rating or an entry changes, see `reset()`.
+"""
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import FloatField
+from django.db.models.functions import Coalesce
+
+from .models import Entry, Rating
+
+VERSION_KEY = "results:version"
+TIMEOUT = 24 * 60 * 60
+
+# two-sided 95% Student's t quantiles for 1 to 30 degrees of freedom
+# fmt: off
+T_975 = np.array(
+    [
+        12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+    ]
+)
+# fmt: on
+Z_975 = 1.96
+
+# fewer ratings than this and a reviewer's scores are used as they are
+MIN_RATINGS = 3
+
+
+def get_t_values(dof):
+    index = np.clip(dof, 1, len(T_975)) - 1
+    return np.where(dof > len(T_975), Z_975, T_975[index])
+
+
+def normalize_scores(user_ids, scores):
+    """
+    Reviewer-normalized `scores`, on the scale of all `scores`.
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    counts = np.bincount(user_index)
+    means = np.bincount(user_index, scores) / counts
+    deviations = scores - means[user_index]
+    stds = np.sqrt(np.bincount(user_index, deviations ** 2) / counts)
+
+    overall_std = scores.std() or 1.0
+    scale = np.where(stds > 0, stds, overall_std)
+    normalized = scores.mean() + deviations / scale[user_index] * overall_std
+    return np.where(counts[user_index] >= MIN_RATINGS, normalized, scores)
+
+
+def compute_category(entry_ids, user_ids, scores):
+    """
+    Per-entry aggregates of one category's ratings, as arrays of entry ids,
+    rating counts, raw means, normalized means and the bounds of their
+    confidence intervals (NaN for entries with a single rating).
+    """
+    normalized = normalize_scores(user_ids, scores)
+
+    entries, entry_index = np.unique(entry_ids, return_inverse=True)
+    counts = np.bincount(entry_index)
+    raw_means = np.bincount(entry_index, scores) / counts
+    means = np.bincount(entry_index, normalized) / counts
+
+    squares = np.bincount(entry_index, (normalized - means[entry_index]) ** 2)
+    dof = counts - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.sqrt(squares / np.maximum(dof, 1) / counts)
+    margins = np.where(dof > 0, get_t_values(dof) * errors, np.nan)
+
+    return entries, counts, raw_means, means, means - margins, means + margins
+
+
+def to_number(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def load_ratings():
+    rows = (
+        Rating.dones.annotate(
+            score=Coalesce("individual", "average", output_field=FloatField())
+        )
+        .filter(score__isnull=False, entry__category__isnull=False)
+        .order_by("entry__category_id")
+        .values_list("entry__category_id", "entry_id", "user_id", "score")
+    )
+    return np.array(list(rows), dtype=float).reshape(-1, 4)
+
+
+def build_results():
+    """
+    A list of categories, each with its entries ranked by normalized mean
+    score.
+    """
+    ratings = load_ratings()
+    if not len(ratings):
+        return []
+
+    entries = (
+        Entry.objects.select_related("category")
+        .defer("data")
+        .in_bulk(np.unique(ratings[:, 1]).astype(int).tolist())
+    )
+
+    # rows are sorted by category, so each category is one slice
+    _, starts = np.unique(ratings[:, 0], return_index=True)
+    categories = {}
+    for rows in np.split(ratings, starts[1:]):
+        computed = compute_category(rows[:, 1], rows[:, 2], rows[:, 3])
+
+        ranked = []
+        for entry_id, count, raw_mean, mean, low, high in zip(*computed):
+            entry = entries[int(entry_id)]
+            ranked.append(
+                {
+                    "pk": entry.pk,
+                    "entry_id": entry.entry_id,
+                    "title": entry.title,
+                    "subcategory": entry.subcategory,
+                    "count": int(count),
+                    "raw_mean": to_number(raw_mean),
+                    "mean": to_number(mean),
+                    "low": to_number(low),
+                    "high": to_number(high),
+                }
+            )
+        ranked.sort(key=lambda item: (-item["mean"], -item["count"], item["pk"]))
+
+        subcategory_ranks = {}
+        for rank, item in enumerate(ranked, 1):
+            item["rank"] = rank
+            subcategory_ranks[item["subcategory"]] = (
+                subcategory_ranks.get(item["subcategory"], 0) + 1
+            )
+            item["subcategory_rank"] = subcategory_ranks[item["subcategory"]]
+
+        category = entries[ranked[0]["pk"]].category
+        categories[category.name] = {
+            "id": category.pk,
+            "name": category.name,
+            "entries": ranked,
+        }
+
+    return [categories[name] for name in sorted(categories)]
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        cache.add(VERSION_KEY, version, None)
+    return version
+
+
+def get_results():
+    key = "results:{}".format(get_version())
+    results = cache.get(key)
+    if results is None:
+        results = build_results()
+        cache.set(key, results, TIMEOUT)
+    return results
+
+
+def reset():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ballots, counters, grids, results
+from .models import Entry, Rating, ReviewerProfile
+
+
+def on_status_change(rating, old_status, new_status):
+    if old_status == new_status:
+        return
+
+    def update():
+        if counters.group_changed(old_status, new_status):
+            scope_ids = counters.get_scope_ids(rating)
+            counters.rating_changed(scope_ids, old_status, new_status)
+            grids.touch([scope_ids["category"]])
+        ballots.clear_user(rating.user_id)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=Rating)
+def update_counters_on_save(sender, instance, created, **kwargs):
+    on_status_change(
+        instance, None if created else instance._loaded_status, instance.status
+    )
+
+
+@receiver(post_delete, sender=Rating)
+def update_counters_on_delete(sender, instance, **kwargs):
+    on_status_change(instance, instance._loaded_status, None)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def clear_results(sender, instance, **kwargs):
+    # scores only count once done, and can change while staying done
+    if "done" in [instance._loaded_status, instance.status]:
+        transaction.on_commit(results.reset)
+
+
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def clear_entry_caches(sender, instance, **kwargs):
+    def clear():
+        Entry.clear_field_groups([instance.pk])
+        ballots.reset()
+        grids.touch([instance.category_id])
+        results.reset()
+
+    transaction.on_commit(clear)
+
+
+@receiver(post_save, sender=ReviewerProfile)
+@receiver(post_delete, sender=ReviewerProfile)
+def clear_grids(sender, instance, **kwargs):
+    # the grids mark the reviewer's predictable conflicts in every category
+    transaction.on_commit(grids.reset)
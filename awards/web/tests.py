@@ -1,3 +1,1702 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import os
+import random
+import re
+import smtplib
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from collections import Counter, namedtuple
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+import xlrd
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Max
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import counters, grids
+from .affinity import AffinityIndex, normalize
+from .assignment import allocate, apply_assignments, rebalance
+from .exports import AllReviewsSheet, Link, get_review_sheets, stream_xlsx
+from .gforms import LabelPlan, fetch_pages, import_entries, sync_entries
+from .middleware import get_fingerprint
+from .models import (
+    Category,
+    Entry,
+    EntryScore,
+    LoginKey,
+    OutboxEmail,
+    Rating,
+    RATING_CHOICES,
+    ReviewerProfile,
+    SyncWatermark,
+    hash_login_key,
+)
+from .outbox import MAX_ATTEMPTS, send_batch
+from .reports import get_reviewer_workload
+from .results import compute_category, get_results
+
+
+class RatingIndexTest(TestCase):
+    """
+    Checks that the hot `Rating` lookups are answered from an index rather
+    than by scanning the table, from PostgreSQL's query plans (the models'
+    JSONFields need PostgreSQL anyway).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Open Assets Awards")
+        cls.users = [
+            User.objects.create(username="reviewer{}".format(i)) for i in range(20)
+        ]
+        cls.entries = Entry.objects.bulk_create(
+            [
+                Entry(id=i, entry_id=i, title="Entry {}".format(i), category=category)
+                for i in range(1, 51)
+            ]
+        )
+        statuses = [status for status, label in RATING_CHOICES]
+        Rating.objects.bulk_create(
+            [
+                Rating(entry=entry, user=user, status=statuses[(i + j) % 4])
+                for i, entry in enumerate(cls.entries)
+                for j, user in enumerate(cls.users)
+            ]
+        )
+
+    def get_plan(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE web_rating")
+            # with test-sized tables a sequential scan is always cheapest
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = self.get_plan(queryset)
+
+        self.assertTrue(
+            any(index_name in plan for index_name in index_names),
+            "None of {} used in:\n{}".format(index_names, plan),
+        )
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_user_status_lookups(self):
+        user = self.users[0]
+        for queryset in [
+            Rating.drafts.filter(user=user),
+            Rating.dones.filter(user=user),
+            Rating.conflicts.filter(user=user),
+        ]:
+            self.assertUsesIndex(queryset, "web_rating_user_status_idx")
+
+    def test_entry_status_lookups(self):
+        entry = self.entries[0]
+        for queryset in [
+            Rating.drafts.filter(entry=entry),
+            Rating.dones.filter(entry=entry),
+            Rating.conflicts.filter(entry=entry),
+        ]:
+            self.assertUsesIndex(
+                queryset, "web_rating_entry_status_idx", "web_rating_unique_entry_user",
+            )
+
+    def test_entry_user_lookup(self):
+        self.assertUsesIndex(
+            Rating.objects.filter(entry=self.entries[0], user=self.users[0]),
+            "web_rating_unique_entry_user",
+        )
+
+
+BENCHMARK_CATEGORIES = [
+    "Open Assets Awards",
+    "Open Practices Awards",
+    "Individual Awards",
+    "Special Awards",
+]
+BENCHMARK_COUNTRIES = ["Slovenia", "Canada", "Chile", "Kenya"]
+
+
+def create_benchmark_data(
+    entries_per_category=10, reviewers=10, reviews_per_entry=3, seed=0
+):
+    """
+    Adds synthetic entries, reviewers and ratings to the database; calling it
+    again grows the data set. Ratings cycle through all RATING_CHOICES states
+    and completed ones are scored.
+    """
+    rnd = random.Random(seed)
+    statuses = [status for status, label in RATING_CHOICES]
+    first_user = (User.objects.aggregate(pk=Max("pk"))["pk"] or 0) + 1
+    first_entry = (Entry.objects.aggregate(pk=Max("pk"))["pk"] or 0) + 1
+
+    User.objects.get_or_create(
+        username="staff", defaults={"is_staff": True, "email": "staff@example.com"}
+    )
+    User.objects.bulk_create(
+        [
+            User(
+                username="reviewer{}".format(i),
+                first_name="Reviewer",
+                last_name=str(i),
+                email="reviewer{}@example.com".format(i),
+            )
+            for i in range(first_user, first_user + reviewers)
+        ]
+    )
+    users = list(User.objects.filter(is_staff=False))
+
+    entries = []
+    for name in BENCHMARK_CATEGORIES:
+        category, _ = Category.objects.get_or_create(name=name)
+        for i in range(entries_per_category):
+            pk = first_entry + len(entries)
+            entries.append(
+                Entry(
+                    id=pk,
+                    entry_id=pk,
+                    title="Entry {}".format(pk),
+                    category=category,
+                    subcategory="Subcategory {}".format(i % 3),
+                    country=BENCHMARK_COUNTRIES[pk % len(BENCHMARK_COUNTRIES)],
+                    link="https://example.com/{}".format(pk),
+                    institution="University {}".format(pk % 7),
+                    nominator_institution="College {}".format(pk % 5),
+                    data={
+                        "Title": "Entry {}".format(pk),
+                        "Link": "https://example.com/{}".format(pk),
+                        "License": "CC BY",
+                        "Description": "Lorem ipsum " * 50,
+                        "City": "Ljubljana",
+                        "Country": BENCHMARK_COUNTRIES[pk % len(BENCHMARK_COUNTRIES)],
+                        "C_First": "Nominee",
+                        "C_Last": str(pk),
+                        "C_Email": "nominee{}@example.com".format(pk),
+                        "C_Institution": "University {}".format(pk % 7),
+                        "N_First": "Nominator",
+                        "N_Last": str(pk),
+                        "N_Email": "nominator{}@example.com".format(pk),
+                        "N_Institution": "College {}".format(pk % 5),
+                        "Letter of Support (required if self-nominating)": [
+                            "https://example.com/letters/{}.pdf".format(pk)
+                        ],
+                        "Additional Support Material (optional)": [
+                            "https://example.com/material/{}-{}.pdf".format(pk, n)
+                            for n in range(3)
+                        ],
+                    },
+                )
+            )
+    Entry.objects.bulk_create(entries)
+
+    ratings = []
+    for entry in entries:
+        for user in rnd.sample(users, min(reviews_per_entry, len(users))):
+            status = statuses[len(ratings) % len(statuses)]
+            scores = {}
+            if status == "done":
+                scores = {"individual": rnd.randint(1, 10), "comment": "Comment"}
+                for field in ["access", "quality", "visual", "engagement"]:
+                    scores[field] = rnd.randint(1, 10)
+            ratings.append(Rating(entry=entry, user=user, status=status, **scores))
+    for rating in ratings:
+        rating.average = rating.compute_average()
+    Rating.objects.bulk_create(ratings)
+
+    EntryScore.refresh()
+
+
+def write_csv(testcase, rows):
+    directory = tempfile.TemporaryDirectory()
+    testcase.addCleanup(directory.cleanup)
+    path = os.path.join(directory.name, "reviewers.csv")
+    with open(path, "w", newline="") as fp:
+        csv.writer(fp).writerows(rows)
+    return path
+
+
+def run_on_commit_callbacks():
+    # TestCase never commits, so run what would run on commit by hand
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for sids, func in callbacks:
+        func()
+
+
+Measurement = namedtuple("Measurement", ["status_code", "queries", "time", "memory"])
+
+
+class ViewBenchmark(TestCase):
+    """
+    Requests every URL in web.urls as staff and as a reviewer with a cold
+    cache, recording query counts, wall time and peak memory.
+
+    Each case is (name, method, staff budget, reviewer budget), budgets being
+    the number of queries the view runs today, or None to skip the request
+    for that user. The counts include the configured database cache and the
+    work done on commit, such as signal receivers updating the caches. Set
+    BENCHMARK_REPORT=1 to print the measurements.
+    """
+
+    cases = [
+        ("index", "get", 2, 2),
+        ("login-key-check", "get", 5, 5),
+        ("submissions", "get", 10, 10),
+        ("entry-detail", "get", 26, 9),
+        ("entry-detail", "post", None, 7),
+        ("entry-assign-user", "post", 18, 2),
+        ("staff-index", "get", 12, 2),
+        ("staff-submissions", "get", 13, 2),
+        ("staff-user-list", "get", 13, 2),
+        ("staff-user-workload", "get", 3, 2),
+        ("staff-user-invite", "post", 5, 2),
+        ("staff-assignment", "get", 3, 2),
+        ("staff-assignment-category", "get", 31, 2),
+        ("staff-assignment-batch", "post", 22, 2),
+        ("staff-assignment-rebalance", "get", 10, 2),
+        ("staff-results", "get", 12, 2),
+        ("staff-export", "get", 16, 2),
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if os.environ.get("BENCHMARK_REPORT") and cls.results:
+            sys.stderr.write(
+                "\n{:<40} {:>7} {:>9} {:>10}\n".format(
+                    cls.__name__, "queries", "time ms", "peak KiB"
+                )
+            )
+            for label, measurement in cls.results:
+                sys.stderr.write(
+                    "{:<40} {:>7} {:>9.1f} {:>10.1f}\n".format(
+                        label,
+                        measurement.queries,
+                        measurement.time * 1000,
+                        measurement.memory / 1024,
+                    )
+                )
+
+    def get_request(self, name, method, user):
+        reviewer = User.objects.filter(is_staff=False).order_by("pk").first()
+        rating = Rating.drafts.filter(user=reviewer).order_by("pk").first()
+        kwargs = {}
+        data = None
+        if name == "login-key-check":
+            kwargs = {
+                "key": LoginKey.objects.create(user=user, email=user.email).raw_key
+            }
+        elif name == "entry-detail":
+            kwargs = {"pk": rating.entry_id}
+            if method == "post":
+                data = {"is_draft": "on", "comment": "Draft"}
+        elif name == "entry-assign-user":
+            kwargs = {"pk": rating.entry_id, "user_id": reviewer.pk}
+        elif name == "staff-assignment-category":
+            kwargs = {"pk": rating.entry.category_id}
+        elif name == "staff-assignment-batch":
+            entries = Entry.objects.exclude(rating__user=reviewer).order_by("pk")
+            drafts = Rating.drafts.filter(user=reviewer).order_by("pk")[:5]
+            operations = [
+                {"entry": draft.entry_id, "user": reviewer.pk, "assign": False}
+                for draft in drafts
+            ] + [
+                {"entry": entry.pk, "user": reviewer.pk, "assign": True}
+                for entry in entries[:5]
+            ]
+            data = json.dumps({"operations": operations})
+        elif name == "staff-assignment-rebalance":
+            data = {"reviews": 3, "stale_days": 7, "seed": 1}
+        return reverse(name, kwargs=kwargs), data
+
+    def measure(self, name, method, user):
+        url, data = self.get_request(name, method, user)
+        self.client.force_login(user)
+        run_on_commit_callbacks()
+        cache.clear()
+
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if isinstance(data, str):
+                response = self.client.post(url, data, "application/json")
+            else:
+                response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            # TestCase never commits, so run what the request left for then
+            run_on_commit_callbacks()
+            elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # savepoints stand in for the transactions TestCase can't commit
+        count = sum(
+            1
+            for query in queries.captured_queries
+            if "SAVEPOINT" not in query["sql"].split(" ", 2)[:2]
+        )
+        measurement = Measurement(response.status_code, count, elapsed, memory)
+        self.results.append(
+            ("{} {} as {}".format(method.upper(), name, user), measurement)
+        )
+        self.assertLess(response.status_code, 500, url)
+        return measurement, queries
+
+    def get_users(self):
+        return [
+            User.objects.get(username="staff"),
+            User.objects.filter(is_staff=False).order_by("pk").first(),
+        ]
+
+
+class ViewQueryBudgetTest(ViewBenchmark):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data()
+
+    def test_query_budgets(self):
+        for name, method, *budgets in self.cases:
+            for user, budget in zip(self.get_users(), budgets):
+                if budget is None:
+                    continue
+                with self.subTest(name=name, method=method, user=user.username):
+                    measurement, queries = self.measure(name, method, user)
+                    self.assertLessEqual(
+                        measurement.queries,
+                        budget,
+                        "\n".join(query["sql"] for query in queries.captured_queries),
+                    )
+
+
+class ViewScalingTest(ViewBenchmark):
+    """
+    Grows the entries and ratings fourfold and checks that no view runs more
+    queries. With BENCHMARK_TIMING=1 it also checks that none takes more
+    than linearly longer or more memory; timings are too noisy on shared
+    machines to check by default.
+    """
+
+    growth = 4
+    # headroom for timer noise; quadratic growth would still be twice over
+    tolerance = 2
+
+    def measure_all(self):
+        measurements = {}
+        for name, method, *budgets in self.cases:
+            if method != "get":
+                continue
+            for user, budget in zip(self.get_users(), budgets):
+                if budget is None:
+                    continue
+                measurements[name, user.username] = min(
+                    (self.measure(name, method, user)[0] for _ in range(3)),
+                    key=lambda measurement: measurement.time,
+                )
+        return measurements
+
+    def test_linear_scaling(self):
+        create_benchmark_data(entries_per_category=5, reviewers=10, seed=1)
+        small = self.measure_all()
+        create_benchmark_data(
+            entries_per_category=5 * (self.growth - 1), reviewers=0, seed=2
+        )
+        large = self.measure_all()
+
+        limit = self.growth * self.tolerance
+        for key, before in small.items():
+            after = large[key]
+            with self.subTest(name=key[0], user=key[1]):
+                self.assertLessEqual(after.queries, before.queries)
+                if os.environ.get("BENCHMARK_TIMING"):
+                    self.assertLessEqual(after.time, before.time * limit)
+                    self.assertLessEqual(after.memory, before.memory * limit)
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SERVER_TIMING=True)
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=2, reviewers=3)
+
+    def test_profile(self):
+        self.client.force_login(User.objects.get(username="staff"))
+
+        with self.assertLogs("web.profiling", "INFO") as logs:
+            response = self.client.get(reverse("staff-index"))
+
+        self.assertIn("db;dur=", response["Server-Timing"])
+        self.assertRegex(logs.output[0], r"view=staff-index method=GET status=200 ")
+        self.assertTrue(any("slowest_ms=" in line for line in logs.output))
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            get_fingerprint(
+                "SELECT * FROM a WHERE id IN (%s, %s) AND x = 'y' LIMIT 21"
+            ),
+            get_fingerprint("SELECT * FROM a WHERE id IN (%s) AND x = 'z' LIMIT 1"),
+        )
+
+
+class OutboxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="reviewer", email="reviewer@example.com"
+        )
+
+    def test_login_email_is_queued(self):
+        response = self.client.post(reverse("index"), {"email": self.user.email})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().status, "queued")
+
+        call_command("send_outbox", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        raw_key = re.search(r"/login/(\w+)/", mail.outbox[0].body).group(1)
+        self.assertEqual(LoginKey.objects.get().key, hash_login_key(raw_key))
+        self.assertEqual(OutboxEmail.objects.get().status, "sent")
+
+    def test_failed_send_is_retried(self):
+        LoginKey.objects.create(user=self.user, email=self.user.email).send_email()
+
+        with mock.patch.object(
+            EmailMessage, "send", side_effect=smtplib.SMTPException("Timeout")
+        ):
+            self.assertEqual(send_batch(), (0, 1))
+
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ("queued", 1))
+        self.assertGreater(email.next_attempt, timezone.now())
+        self.assertEqual(send_batch(), (0, 0))
+
+        email.next_attempt = timezone.now()
+        email.save()
+        self.assertEqual(send_batch(), (1, 0))
+
+    def test_email_is_claimed_before_sending(self):
+        LoginKey.objects.create(user=self.user, email=self.user.email).send_email()
+        savepoints = len(connection.savepoint_ids)
+        seen = []
+
+        def send(message):
+            # the claim is committed and no transaction is open while sending
+            seen.append(OutboxEmail.objects.get().status)
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+
+        with mock.patch.object(EmailMessage, "send", autospec=True, side_effect=send):
+            self.assertEqual(send_batch(), (1, 0))
+
+        self.assertEqual(seen, ["sending"])
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ("sent", 1))
+
+    def test_expired_claim_is_taken_over(self):
+        now = timezone.now()
+        LoginKey.objects.create(user=self.user, email=self.user.email).send_email()
+        OutboxEmail.objects.update(
+            status="sending", attempts=1, next_attempt=now + datetime.timedelta(1)
+        )
+        self.assertEqual(send_batch(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt=now)
+        self.assertEqual(send_batch(), (1, 0))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ("sent", 2))
+
+        OutboxEmail.objects.update(
+            status="sending", attempts=MAX_ATTEMPTS, next_attempt=now
+        )
+        self.assertEqual(send_batch(), (0, 0))
+        self.assertEqual(OutboxEmail.objects.get().status, "failed")
+
+
+class ReviewerWorkloadTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Open Assets Awards")
+        entries = [
+            Entry.objects.create(
+                entry_id=i, title="Entry {}".format(i), category=category
+            )
+            for i in range(4)
+        ]
+        cls.ana = User.objects.create(username="ana", first_name="Ana")
+        cls.bo = User.objects.create(username="bo", first_name="Bo")
+        cls.cy = User.objects.create(username="cy", first_name="Cy")
+        User.objects.create(username="gone", is_active=False)
+        User.objects.create(username="admin", is_staff=True, is_superuser=True)
+
+        for entry, status in zip(entries, ["done", "done", "conflict", "draft"]):
+            Rating.objects.create(entry=entry, user=cls.ana, status=status)
+        Rating.objects.create(entry=entries[0], user=cls.bo, status="empty")
+        Rating.objects.filter(user=cls.ana).update(
+            updated=datetime.datetime(2020, 8, 1, 12)
+        )
+
+    def test_counts(self):
+        workload = {user.username: user for user in get_reviewer_workload()}
+
+        self.assertEqual(list(workload), ["ana", "bo", "cy"])
+        ana = workload["ana"]
+        self.assertEqual(
+            (ana.dones, ana.conflicts, ana.drafts, ana.total, ana.completion),
+            (2, 1, 1, 4, 0.75),
+        )
+        self.assertEqual(ana.last_activity, datetime.datetime(2020, 8, 1, 12))
+        self.assertEqual((workload["bo"].total, workload["bo"].completion), (1, 0))
+        self.assertEqual((workload["cy"].total, workload["cy"].completion), (0, None))
+
+    def get_usernames(self, **filters):
+        return [user.username for user in get_reviewer_workload(**filters)]
+
+    def test_sort_and_filter(self):
+        self.assertEqual(self.get_usernames(sort="completion"), ["bo", "ana", "cy"])
+        self.assertEqual(self.get_usernames(sort="-drafts"), ["ana", "bo", "cy"])
+        self.assertEqual(self.get_usernames(min_completion=0.5), ["ana"])
+        self.assertEqual(self.get_usernames(max_completion=0.5), ["bo"])
+
+    def test_view(self):
+        self.client.force_login(User.objects.get(username="admin"))
+
+        response = self.client.get(
+            reverse("staff-user-workload"), {"sort": "-completion"}
+        )
+
+        reviewers = response.json()["reviewers"]
+        self.assertEqual(
+            [reviewer["id"] for reviewer in reviewers],
+            [self.ana.pk, self.bo.pk, self.cy.pk],
+        )
+        self.assertEqual(
+            {key: reviewers[0][key] for key in ["dones", "drafts", "total"]},
+            {"dones": 2, "drafts": 1, "total": 4},
+        )
+
+
+class InviteReviewersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=2, reviewers=12)
+
+    def test_command(self):
+        reviewers = LoginKey.get_invitees()
+        out = StringIO()
+
+        call_command("invite_reviewers", stdout=out)
+        self.assertFalse(LoginKey.objects.exists())
+
+        call_command("invite_reviewers", commit=True, batch_size=5, stdout=out)
+        self.assertEqual(LoginKey.objects.count(), len(reviewers))
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(user.email for user in reviewers),
+        )
+        raw_keys = [re.search(r"/login/(\w+)/", m.body).group(1) for m in mail.outbox]
+        self.assertEqual(
+            set(LoginKey.objects.values_list("key", flat=True)),
+            {hash_login_key(raw_key) for raw_key in raw_keys},
+        )
+        self.assertFalse(OutboxEmail.objects.exclude(status="sent").exists())
+
+    def test_filters(self):
+        reviewer = LoginKey.get_invitees()[0]
+        self.assertEqual(LoginKey.get_invitees([reviewer.email.upper()]), [reviewer])
+
+        pending = LoginKey.get_invitees(pending=True)
+        for user in pending:
+            self.assertTrue(Rating.drafts.filter(user=user).exists())
+
+
+class LoginKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username="reviewer", email="reviewer@example.com"
+        )
+
+    def test_key_is_hashed(self):
+        login_key = LoginKey.objects.create(user=self.user, email=self.user.email)
+
+        self.assertNotEqual(login_key.key, login_key.raw_key)
+        self.assertFalse(LoginKey.objects.filter(key=login_key.raw_key).exists())
+        self.assertIn(login_key.raw_key, str(login_key.get_absolute_url()))
+
+    def test_single_use(self):
+        login_key = LoginKey.objects.create(user=self.user, email=self.user.email)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(LoginKey.use(login_key.raw_key), self.user.pk)
+        self.assertIsNone(LoginKey.use(login_key.raw_key))
+
+        response = self.client.get(login_key.get_absolute_url())
+        self.assertTemplateUsed(response, "mail-login/login_failed.html")
+
+    def test_login(self):
+        login_key = LoginKey.objects.create(user=self.user, email=self.user.email)
+
+        response = self.client.get(login_key.get_absolute_url())
+
+        self.assertRedirects(response, reverse("submissions"))
+        self.assertEqual(response.wsgi_request.user, self.user)
+
+    def test_expired_keys(self):
+        fresh, old, used = [
+            LoginKey.objects.create(user=self.user, email=self.user.email)
+            for _ in range(3)
+        ]
+        LoginKey.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - datetime.timedelta(days=8)
+        )
+        LoginKey.use(used.raw_key)
+
+        self.assertIsNone(LoginKey.use(old.raw_key))
+
+        call_command("prune_login_keys", batch_size=1, stdout=StringIO())
+        self.assertEqual(list(LoginKey.objects.all()), [fresh])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=3, reviewers=4)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_expected(self, **filters):
+        ratings = Rating.objects.filter(**filters)
+        return {
+            "dones": ratings.filter(status="done").count(),
+            "drafts": ratings.filter(status__in=["empty", "draft"]).count(),
+            "conflicts": ratings.filter(status="conflict").count(),
+        }
+
+    def assertCountsMatch(self, rating):
+        category_id = rating.entry.category_id
+        self.assertEqual(counters.get_global_counts(), self.get_expected())
+        self.assertEqual(
+            counters.get_scoped_counts("category", [category_id])[category_id],
+            self.get_expected(entry__category_id=category_id),
+        )
+        self.assertEqual(
+            counters.get_user_counts([rating.user_id])[rating.user_id],
+            self.get_expected(user_id=rating.user_id),
+        )
+        self.assertEqual(
+            counters.get_entry_counts([rating.entry_id])[rating.entry_id],
+            self.get_expected(entry_id=rating.entry_id),
+        )
+
+    def test_signals_keep_counts_in_step(self):
+        rating = Rating.drafts.select_related("entry").order_by("pk").first()
+        self.assertCountsMatch(rating)
+
+        rating.status = "done"
+        rating.save()
+        run_on_commit_callbacks()
+        expected = self.get_expected(entry_id=rating.entry_id)
+        with CaptureQueriesContext(connection) as queries:
+            counts = counters.get_entry_counts([rating.entry_id])
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(counts[rating.entry_id], expected)
+        self.assertCountsMatch(rating)
+
+        rating.delete()
+        run_on_commit_callbacks()
+        self.assertCountsMatch(rating)
+
+    def test_entry_counts_are_one_key(self):
+        entries = list(Entry.objects.order_by("pk").values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            counts = counters.get_entry_counts(entries[:2])
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(counts[entries[0]], self.get_expected(entry_id=entries[0]))
+
+        with CaptureQueriesContext(connection) as queries:
+            counts = counters.get_entry_counts(entries)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(counts[entries[-1]], self.get_expected(entry_id=entries[-1]))
+
+        rating = Rating.drafts.filter(entry_id=entries[0]).first()
+        rating.status = "conflict"
+        rating.save()
+        run_on_commit_callbacks()
+        self.assertEqual(
+            cache.get(counters.make_key("entry"))[entries[0]],
+            self.get_expected(entry_id=entries[0]),
+        )
+
+    def test_evicted_version_is_not_reused(self):
+        counters.get_global_counts()
+        stale_key = counters.make_key("all")
+        Rating.objects.filter(status="draft").update(status="done")
+        counters.reset()
+
+        cache.delete(counters.VERSION_KEY)
+        self.assertNotEqual(counters.make_key("all"), stale_key)
+
+    def test_user_list_counts_follow_the_report(self):
+        self.client.force_login(User.objects.get(username="staff"))
+        counters.get_user_counts(User.objects.values_list("pk", flat=True))
+        # a change the cached counters miss
+        Rating.objects.filter(status="draft").update(status="done")
+
+        response = self.client.get(reverse("staff-user-list"), {"sort": "-drafts"})
+        drafts = [row["drafts"] for row in response.context["data"]]
+        self.assertEqual(drafts, sorted(drafts, reverse=True))
+        self.assertEqual(
+            drafts,
+            [
+                self.get_expected(user=row["user"])["drafts"]
+                for row in response.context["data"]
+            ],
+        )
+
+    def test_annotated_entries_match_the_query(self):
+        expected = {
+            entry.pk: (entry.num_dones, entry.num_drafts, entry.num_conflicts)
+            for entry in Entry.objects.with_status_counts()
+        }
+        entries = counters.annotate_entries(Entry.objects.all())
+        self.assertEqual(
+            {
+                entry.pk: (entry.num_dones, entry.num_drafts, entry.num_conflicts)
+                for entry in entries
+            },
+            expected,
+        )
+
+    def test_staff_ballots_show_review_counts(self):
+        staff = User.objects.get(username="staff")
+        entry = Entry.objects.with_status_counts().order_by("pk").first()
+        Rating.objects.create(entry=entry, user=staff, status="done")
+        self.client.force_login(staff)
+
+        response = self.client.get(reverse("submissions"))
+
+        self.assertContains(
+            response,
+            "{} Review{}".format(
+                entry.num_dones + 1, "" if entry.num_dones == 0 else "s"
+            ),
+        )
+        self.assertEqual(
+            response.context["done_entries"][0].entry.num_dones, entry.num_dones + 1
+        )
+
+
+class BallotCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=3, reviewers=4)
+
+    def setUp(self):
+        self.user = User.objects.filter(is_staff=False).order_by("pk").first()
+        self.client.force_login(self.user)
+
+    def get_ballots(self):
+        context = self.client.get(reverse("submissions")).context
+        return {
+            group: [rating.pk for rating in context[group]]
+            for group in ["draft_entries", "done_entries", "conflict_entries"]
+        }
+
+    def test_ballots_are_cached(self):
+        self.get_ballots()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_ballots()
+
+        self.assertFalse(
+            any("web_rating" in query["sql"] for query in queries.captured_queries)
+        )
+
+    def test_rating_save_clears_cache(self):
+        ballots = self.get_ballots()
+
+        rating = Rating.objects.get(pk=ballots["draft_entries"][0])
+        rating.status = "done"
+        rating.save()
+        run_on_commit_callbacks()
+
+        updated = self.get_ballots()
+        self.assertNotIn(rating.pk, updated["draft_entries"])
+        self.assertIn(rating.pk, updated["done_entries"])
+
+
+class FakeGravityForms:
+    """
+    Stands in for the Gravity Forms entries endpoint: pages through
+    `entries`, oldest update first, and applies the `date_updated` search.
+    """
+
+    labels = {"101": "Title", "102": "Main Category", "103": "Country"}
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.requests = []
+
+    def __call__(self, url, params):
+        self.requests.append(params)
+        entries = sorted(self.entries, key=lambda entry: entry["date_updated"])
+        if "search" in params:
+            (search,) = json.loads(params["search"])["field_filters"]
+            entries = [e for e in entries if e["date_updated"] > search["value"]]
+
+        size = params["paging[page_size]"]
+        start = (params["paging[current_page]"] - 1) * size
+        return {
+            "total_count": len(entries),
+            "entries": entries[start : start + size],
+            "_labels": self.labels,
+        }
+
+
+def make_raw_entry(pk, date_updated="2020-07-01 10:00:00"):
+    return {
+        "id": str(pk),
+        "date_updated": date_updated,
+        "101": "Entry {}".format(pk),
+        "102": "Open Assets Awards",
+        "103": "Chile",
+    }
+
+
+class ImportEntriesTest(TestCase):
+    def test_fetch_pages(self):
+        fetcher = FakeGravityForms([make_raw_entry(pk) for pk in range(1, 8)])
+
+        pages = list(fetch_pages(fetcher, "url", page_size=3))
+
+        self.assertEqual([len(entries) for labels, entries in pages], [3, 3, 1])
+        self.assertEqual(
+            [params["paging[current_page]"] for params in fetcher.requests], [1, 2, 3]
+        )
+        self.assertEqual(pages[0][0], FakeGravityForms.labels)
+
+    def test_fetch_pages_stops_on_empty_page(self):
+        fetcher = mock.Mock(
+            side_effect=[
+                {"total_count": 5, "entries": [make_raw_entry(1)]},
+                {"total_count": 5, "entries": []},
+            ]
+        )
+
+        pages = list(fetch_pages(fetcher, "url", page_size=1))
+
+        self.assertEqual([len(entries) for labels, entries in pages], [1, 0])
+
+    def test_import_creates_updates_and_prunes(self):
+        fetcher = FakeGravityForms([make_raw_entry(pk) for pk in range(1, 6)])
+        result = import_entries(fetcher, "url", page_size=2)
+        self.assertEqual(len(result.created), 5)
+        entry = Entry.objects.get(entry_id=3)
+        self.assertEqual(
+            (entry.title, entry.category.name, entry.country),
+            ("Entry 3", "Open Assets Awards", "Chile"),
+        )
+        Rating.objects.create(
+            entry=entry, user=User.objects.create(username="reviewer")
+        )
+
+        fetcher.entries = [make_raw_entry(pk) for pk in range(2, 6)]
+        fetcher.entries[1]["101"] = "Renamed"
+        result = import_entries(fetcher, "url", page_size=2, prune=True)
+
+        self.assertEqual(
+            (len(result.created), len(result.updated), result.unchanged), (0, 1, 3),
+        )
+        self.assertEqual(result.deleted, 1)
+        self.assertFalse(Entry.objects.filter(entry_id=1).exists())
+        # updated in place, so its ratings are kept
+        self.assertEqual(Entry.objects.get(entry_id=3).title, "Renamed")
+        self.assertTrue(Rating.objects.filter(entry=entry).exists())
+
+    def test_incremental_import_resumes_from_watermark(self):
+        fetcher = FakeGravityForms(
+            [
+                make_raw_entry(1, "2020-07-01 10:00:00"),
+                make_raw_entry(2, "2020-07-02 10:00:00"),
+                make_raw_entry(3, "2020-07-03 10:00:00"),
+            ]
+        )
+        import_entries(fetcher, "url", incremental=True)
+        watermark = SyncWatermark.objects.get(name="entries")
+        self.assertEqual(watermark.date_updated, datetime.datetime(2020, 7, 3, 10))
+        self.assertNotIn("search", fetcher.requests[0])
+
+        fetcher.entries.append(make_raw_entry(4, "2020-07-04 10:00:00"))
+        fetcher.requests = []
+        result = import_entries(fetcher, "url", incremental=True)
+
+        # the boundary second is fetched again and comes out unchanged
+        (search,) = json.loads(fetcher.requests[0]["search"])["field_filters"]
+        self.assertEqual(search["value"], "2020-07-03 09:59:59")
+        self.assertEqual((len(result.created), result.unchanged), (1, 1))
+        watermark.refresh_from_db()
+        self.assertEqual(watermark.date_updated, datetime.datetime(2020, 7, 4, 10))
+
+    def test_incremental_import_never_prunes(self):
+        fetcher = FakeGravityForms([make_raw_entry(1), make_raw_entry(2)])
+        import_entries(fetcher, "url")
+
+        fetcher.entries = []
+        result = import_entries(fetcher, "url", prune=True, incremental=True)
+
+        self.assertEqual(result.deleted, 0)
+        self.assertEqual(Entry.objects.count(), 2)
+
+
+class LabelPlanTest(TestCase):
+    labels = {
+        "1": {"1.3": "First", "1.6": "Last"},
+        "2": "Email",
+        "5": {"5.3": "First", "5.6": "Last"},
+        "6": "Email:",
+        "7": "Title",
+        "8": "Open Assets Subcategory",
+        "date_created": "Date created",
+    }
+    prefixes = {"N_": ["1.*", "2"], "C_": ["5.*", "6"]}
+
+    def test_translate(self):
+        plan = LabelPlan(self.labels, self.prefixes)
+
+        entry = plan.translate(
+            {
+                "id": "42",
+                "1.3": "Nora",
+                "1.6": "Nominator",
+                "2": "nora@example.com",
+                "5.3": "Cai",
+                "5.6": "",
+                "6": "cai@example.com",
+                "7": "Open Textbook",
+                "8": "Open Textbook Award",
+                "date_created": "2020-07-01 10:00:00",
+            }
+        )
+
+        self.assertEqual(
+            entry,
+            {
+                "entry_id": "42",
+                "N_First": "Nora",
+                "N_Last": "Nominator",
+                "N_Email": "nora@example.com",
+                "C_First": "Cai",
+                "C_Email": "cai@example.com",
+                "Title": "Open Textbook",
+                "Open Assets Subcategory": "Open Textbook Award",
+                "Subcategory": "Open Textbook Award",
+            },
+        )
+
+    def test_default_prefixes(self):
+        plan = LabelPlan({"1": {"1.3": "First"}, "5": {"5.3": "First"}})
+
+        self.assertEqual(
+            plan.translate({"1.3": "Nora", "5.3": "Cai"}),
+            {"N_First": "Nora", "C_First": "Cai"},
+        )
+
+    @override_settings(GFORMS_LABEL_PREFIXES={"X_": ["1.*"]})
+    def test_prefixes_setting(self):
+        plan = LabelPlan({"1": {"1.3": "First"}})
+
+        self.assertEqual(plan.translate({"1.3": "Nora"}), {"X_First": "Nora"})
+
+
+class EntryListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=2, reviewers=3)
+
+    def test_list_pages_skip_entry_data(self):
+        reviewer = User.objects.filter(is_staff=False).order_by("pk").first()
+        pages = [
+            (User.objects.get(username="staff"), "staff-submissions"),
+            (User.objects.get(username="staff"), "staff-assignment-category"),
+            (reviewer, "submissions"),
+        ]
+        category = Category.objects.order_by("pk").first()
+        for user, name in pages:
+            self.client.force_login(user)
+            kwargs = {"pk": category.pk} if name == "staff-assignment-category" else {}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name, kwargs=kwargs))
+
+            content = response.content.decode()
+            self.assertTrue(
+                any(country in content for country in BENCHMARK_COUNTRIES), name
+            )
+            for query in queries.captured_queries:
+                self.assertNotIn('"web_entry"."data"', query["sql"], name)
+
+    def test_import_copies_list_fields(self):
+        sync_entries(
+            [
+                {
+                    "entry_id": "1000",
+                    "Title": "Imported",
+                    "Main Category": "Open Assets Awards",
+                    "Country": "Chile",
+                    "Link": "https://example.com/imported",
+                    "C_Institution": "Universidad",
+                }
+            ]
+        )
+
+        entry = Entry.objects.get(entry_id=1000)
+        self.assertEqual(
+            (entry.country, entry.link, entry.institution),
+            ("Chile", "https://example.com/imported", "Universidad"),
+        )
+
+
+class AssignmentBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=3, reviewers=4)
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(username="staff"))
+        self.reviewer = User.objects.filter(is_staff=False).order_by("pk").first()
+
+    def post(self, operations):
+        return self.client.post(
+            reverse("staff-assignment-batch"),
+            json.dumps({"operations": operations}),
+            "application/json",
+        )
+
+    def test_applies_operations(self):
+        draft = Rating.drafts.filter(user=self.reviewer).order_by("pk").first()
+        done = Rating.dones.filter(user=self.reviewer).order_by("pk").first()
+        entry = Entry.objects.exclude(rating__user=self.reviewer).order_by("pk")[0]
+        operations = [
+            {"entry": entry.pk, "user": self.reviewer.pk, "assign": True},
+            {"entry": draft.entry_id, "user": self.reviewer.pk, "assign": False},
+            {"entry": done.entry_id, "user": self.reviewer.pk, "assign": False},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(operations)
+
+        self.assertEqual(response.status_code, 200)
+        deletes = [q for q in queries.captured_queries if q["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 1)
+        self.assertTrue(
+            Rating.objects.filter(
+                entry=entry, user=self.reviewer, status="empty"
+            ).exists()
+        )
+        self.assertFalse(Rating.objects.filter(pk=draft.pk).exists())
+        self.assertTrue(Rating.objects.filter(pk=done.pk).exists())
+        self.assertEqual(
+            response.json()["loads"],
+            {str(self.reviewer.pk): Rating.objects.filter(user=self.reviewer).count()},
+        )
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_keeps_counters_in_step(self):
+        cache.clear()
+        draft = Rating.drafts.filter(user=self.reviewer).order_by("pk").first()
+        entry = Entry.objects.exclude(rating__user=self.reviewer).order_by("pk")[0]
+        counters.get_user_counts([self.reviewer.pk])
+
+        self.post(
+            [
+                {"entry": entry.pk, "user": self.reviewer.pk, "assign": True},
+                {"entry": draft.entry_id, "user": self.reviewer.pk, "assign": False},
+            ]
+        )
+        run_on_commit_callbacks()
+
+        self.assertEqual(
+            counters.get_user_counts([self.reviewer.pk])[self.reviewer.pk]["drafts"],
+            Rating.drafts.filter(user=self.reviewer).count(),
+        )
+
+    def test_unassign_cost_is_flat(self):
+        def count_queries(ratings):
+            with CaptureQueriesContext(connection) as queries:
+                apply_assignments(
+                    unassign=[(rating.entry_id, rating.user_id) for rating in ratings]
+                )
+                run_on_commit_callbacks()
+            return len(queries)
+
+        # one draft per category, then all the others in the same categories
+        first = {}
+        for rating in Rating.drafts.select_related("entry").order_by("pk"):
+            first.setdefault(rating.entry.category_id, rating)
+        rest = Rating.drafts.exclude(pk__in=[rating.pk for rating in first.values()])
+        self.assertEqual(
+            set(rest.values_list("entry__category_id", flat=True)), set(first)
+        )
+        self.assertGreater(rest.count(), 2 * len(first))
+
+        self.assertEqual(count_queries(first.values()), count_queries(list(rest)))
+        self.assertFalse(Rating.drafts.exists())
+
+    def test_rejects_bad_operations(self):
+        self.assertEqual(self.post([{"entry": 1}]).status_code, 400)
+        self.assertEqual(
+            self.post(
+                [{"entry": 0, "user": self.reviewer.pk, "assign": True}]
+            ).status_code,
+            400,
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class AssignmentGridTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_benchmark_data(entries_per_category=3, reviewers=4)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.get(username="staff"))
+        self.rating = Rating.drafts.order_by("pk").first()
+        self.url = reverse(
+            "staff-assignment-category", kwargs={"pk": self.rating.entry.category_id}
+        )
+
+    def get_grid(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        rating_queries = [
+            query for query in queries.captured_queries if "web_rating" in query["sql"]
+        ]
+        return response, rating_queries
+
+    def test_page_lists_categories_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("staff-assignment"))
+
+        self.assertContains(response, self.url)
+        for query in queries.captured_queries:
+            self.assertNotIn('FROM "web_entry"', query["sql"])
+            self.assertNotIn("web_rating", query["sql"])
+
+    def test_grid_is_cached_until_a_rating_changes(self):
+        response, rating_queries = self.get_grid()
+        self.assertContains(response, 'data-entry="{}"'.format(self.rating.entry_id))
+        self.assertTrue(rating_queries)
+
+        response, rating_queries = self.get_grid()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(rating_queries)
+
+        self.rating.status = "done"
+        self.rating.save()
+        run_on_commit_callbacks()
+
+        response, rating_queries = self.get_grid()
+        self.assertTrue(rating_queries)
+
+    def test_batch_assignment_refreshes_grid(self):
+        self.get_grid()
+        self.client.post(
+            reverse("staff-assignment-batch"),
+            json.dumps(
+                {
+                    "operations": [
+                        {
+                            "entry": self.rating.entry_id,
+                            "user": self.rating.user_id,
+                            "assign": False,
+                        }
+                    ]
+                }
+            ),
+            "application/json",
+        )
+        run_on_commit_callbacks()
+
+        response, rating_queries = self.get_grid()
+        self.assertTrue(rating_queries)
+
+
+class AllocateTest(TestCase):
+    entries = [(1, 10), (2, 10), (3, 20)]
+    reviewers = [1, 2, 3, 4]
+
+    def test_tops_up_entries_evenly(self):
+        existing = [(1, 1, "done"), (1, 2, "conflict")]
+
+        allocation = allocate(self.entries, self.reviewers, 3, 3, existing, seed=1)
+
+        ballots = Counter(entry_id for entry_id, user_id in allocation.ballots)
+        self.assertEqual(ballots, {1: 2, 2: 3, 3: 3})
+        self.assertNotIn((1, 1), allocation.ballots)
+        self.assertNotIn((1, 2), allocation.ballots)
+        self.assertEqual(max(allocation.loads.values()), 3)
+        self.assertEqual(allocation.shortfalls, {})
+
+    def test_exclusions_and_shortfalls(self):
+        allocation = allocate(
+            self.entries,
+            self.reviewers,
+            3,
+            2,
+            excluded_pairs={(3, 1)},
+            excluded_categories={2: {20}},
+            seed=1,
+        )
+
+        self.assertNotIn((3, 1), allocation.ballots)
+        self.assertNotIn((3, 2), allocation.ballots)
+        self.assertTrue(all(load <= 2 for load in allocation.loads.values()))
+        # 8 ballots fit under the cap, 9 are needed
+        self.assertEqual(len(allocation.ballots), 8)
+        self.assertEqual(sum(allocation.shortfalls.values()), 1)
+
+    def test_reset_command_refreshes_scores(self):
+        create_benchmark_data(entries_per_category=2, reviewers=3)
+
+        call_command(
+            "init_ratings", "--commit", "--reset", "--seed", "1", stdout=StringIO()
+        )
+
+        self.assertFalse(Rating.dones.exists())
+        self.assertFalse(EntryScore.objects.filter(count__gt=0).exists())
+
+
+class RebalanceTest(TestCase):
+    def test_moves_stalled_ballots(self):
+        now = timezone.now()
+        old = now - datetime.timedelta(days=30)
+        ratings = [
+            # entry 1: one done, one stalled draft, one active empty
+            (1, 10, "done", now),
+            (1, 11, "draft", old),
+            (1, 12, "empty", now),
+            # entry 2: only a conflict
+            (2, 12, "conflict", now),
+        ]
+
+        plan = rebalance([1, 2], [10, 11, 12, 13], ratings, 3, now, seed=0)
+
+        self.assertEqual(plan.moves, [(1, 11, 13)])
+        self.assertEqual(sorted(plan.additions), [(2, 10), (2, 13)])
+        self.assertEqual(plan.shortfalls, {2: 1})
+
+    def test_view_previews_and_applies(self):
+        create_benchmark_data(entries_per_category=3, reviewers=6)
+        Rating.objects.update(updated=timezone.now() - datetime.timedelta(days=30))
+        # new reviewers, without ratings, take over the stalled ballots
+        create_benchmark_data(entries_per_category=0, reviewers=2)
+        self.client.force_login(User.objects.get(username="staff"))
+        data = {"reviews": 3, "stale_days": 7, "seed": 1}
+        ratings = set(Rating.objects.values_list("entry_id", "user_id"))
+
+        response = self.client.get(reverse("staff-assignment-rebalance"), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(Rating.objects.values_list("entry_id", "user_id")), ratings
+        )
+
+        plan = response.context["moves"] + response.context["additions"]
+        self.assertTrue(plan)
+
+        response = self.client.post(
+            reverse("staff-assignment-rebalance"),
+            dict(data, digest=response.context["digest"]),
+        )
+        self.assertRedirects(response, reverse("staff-assignment"), 302, 200)
+        for entry, *users in plan:
+            self.assertTrue(Rating.objects.filter(entry=entry, user=users[-1]).exists())
+
+    def test_view_applies_the_previewed_plan(self):
+        create_benchmark_data(entries_per_category=3, reviewers=6)
+        Rating.objects.update(updated=timezone.now() - datetime.timedelta(days=30))
+        create_benchmark_data(entries_per_category=0, reviewers=4)
+        self.client.force_login(User.objects.get(username="staff"))
+        url = reverse("staff-assignment-rebalance")
+        data = {"reviews": 3, "stale_days": 7}
+        ratings = set(Rating.objects.values_list("entry_id", "user_id"))
+
+        # the seed is part of the applied plan, so it can't be left out
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            set(Rating.objects.values_list("entry_id", "user_id")), ratings
+        )
+
+        response = self.client.get(url, data)
+        seed = response.context["form"]["seed"].value()
+        self.assertIsNotNone(seed)
+        self.assertContains(response, 'name="seed" value="{}"'.format(seed))
+        moves = {
+            (entry.pk, from_user.pk, to_user.pk)
+            for entry, from_user, to_user in response.context["moves"]
+        }
+        additions = {
+            (entry.pk, user.pk) for entry, user in response.context["additions"]
+        }
+        self.assertTrue(moves)
+
+        self.client.post(url, dict(data, seed=seed, digest=response.context["digest"]))
+        expected = (
+            ratings - {(entry_id, from_user) for entry_id, from_user, _ in moves}
+            | {(entry_id, to_user) for entry_id, _, to_user in moves}
+            | additions
+        )
+        self.assertEqual(
+            set(Rating.objects.values_list("entry_id", "user_id")), expected
+        )
+
+    def test_view_refuses_a_plan_that_changed(self):
+        create_benchmark_data(entries_per_category=3, reviewers=6)
+        Rating.objects.update(updated=timezone.now() - datetime.timedelta(days=30))
+        create_benchmark_data(entries_per_category=0, reviewers=4)
+        self.client.force_login(User.objects.get(username="staff"))
+        url = reverse("staff-assignment-rebalance")
+        data = {"reviews": 3, "stale_days": 7, "seed": 1}
+
+        response = self.client.get(url, data)
+        digest = response.context["digest"]
+        self.assertContains(response, 'name="digest" value="{}"'.format(digest))
+
+        # a stalled reviewer comes back between the preview and the apply
+        entry, from_user, to_user = response.context["moves"][0]
+        Rating.objects.filter(user=from_user).update(updated=timezone.now())
+        ratings = set(Rating.objects.values_list("entry_id", "user_id"))
+
+        response = self.client.post(url, dict(data, digest=digest), follow=True)
+        self.assertEqual(
+            set(Rating.objects.values_list("entry_id", "user_id")), ratings
+        )
+        self.assertEqual(response.request["PATH_INFO"], url)
+        self.assertContains(response, "Ballots changed since the preview")
+        self.assertNotEqual(response.context["digest"], digest)
+
+
+class ImportReviewersTest(TestCase):
+    header = ["First", "Last", "Email", "Institution", "Country"]
+
+    def import_reviewers(self, *rows):
+        stdout = StringIO()
+        call_command(
+            "import_reviewers", write_csv(self, [self.header, *rows]), stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_create_update_and_reimport(self):
+        rows = [
+            ["Ana", "Novak", "ana@example.com", "University 1", "Slovenia"],
+            ["Bo", "Lee", "bo@example.com", "", ""],
+        ]
+        self.assertIn("2 created, 0 updated", self.import_reviewers(*rows))
+        ana = User.objects.get(email="ana@example.com")
+        self.assertEqual((ana.username, ana.is_active), ("AnaNovak", True))
+        self.assertEqual(ana.profile.country, "Slovenia")
+        self.assertFalse(
+            ReviewerProfile.objects.filter(user__email="bo@example.com").exists()
+        )
+
+        self.assertIn("0 created, 0 updated, 2 unchanged", self.import_reviewers(*rows))
+
+        ana.is_active = False
+        ana.save()
+        output = self.import_reviewers(
+            ["Ana", "Kos", "ANA@example.com", "University 2", "Slovenia"], rows[1]
+        )
+        self.assertIn("0 created, 1 updated", output)
+        ana.refresh_from_db()
+        self.assertEqual((ana.last_name, ana.is_active), ("Kos", True))
+        self.assertEqual(ana.profile.institution, "University 2")
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_username_falls_back_to_email(self):
+        User.objects.create(username="AnaNovak", email="other@example.com")
+
+        self.import_reviewers(["Ana", "Novak", "ana@example.com"])
+
+        self.assertEqual(
+            User.objects.get(email="ana@example.com").username, "ana@example.com"
+        )
+
+    def test_username_clash_is_refused(self):
+        User.objects.create(username="AnaNovak", email="other@example.com")
+        User.objects.create(username="ana@example.com", email="old@example.com")
+
+        with self.assertRaisesMessage(CommandError, "ana@example.com is taken"):
+            self.import_reviewers(
+                ["Bo", "Lee", "bo@example.com"], ["Ana", "Novak", "ana@example.com"]
+            )
+        self.assertFalse(User.objects.filter(email="bo@example.com").exists())
+
+
+class AffinityTest(TestCase):
+    def test_normalize(self):
+        self.assertEqual(
+            normalize("  Universitat de  València. "), "universitat de valencia"
+        )
+        self.assertEqual(normalize(None), "")
+
+    def test_index(self):
+        index = AffinityIndex(
+            [(1, "MIT", "USA"), (2, "", "Slovenia"), (3, "", "")],
+            [(10, ["mit", ""], "Chile"), (11, ["", None], "slovenia")],
+        )
+
+        self.assertEqual(index.get_conflict(10, 1), "same institution")
+        self.assertEqual(index.get_conflict(11, 2), "same country")
+        self.assertNotIn((10, 2), index)
+        self.assertEqual(len(index), 2)
+
+    def test_import_and_assignment_skip_conflicts(self):
+        create_benchmark_data(entries_per_category=2, reviewers=0)
+        path = write_csv(
+            self,
+            [
+                ["First", "Last", "Email", "Institution", "Country"],
+                ["Ana", "Novak", "ana@example.com", "University 1", "Atlantis"],
+                ["Bo", "Lee", "bo@example.com", "College 2", ""],
+                ["Cy", "Roy", "cy@example.com", "", "canada"],
+                ["Dee", "Ode", "dee@example.com", "Elsewhere", "Atlantis"],
+            ],
+        )
+        call_command("import_reviewers", path, stdout=StringIO())
+
+        entries = Entry.objects.all()
+        conflicts = {
+            "ana@example.com": entries.filter(institution="University 1"),
+            "bo@example.com": entries.filter(nominator_institution="College 2"),
+            "cy@example.com": entries.filter(country="Canada"),
+            "dee@example.com": entries.none(),
+        }
+        call_command("init_ratings", commit=True, reviews=4, stdout=StringIO())
+
+        for email, conflicting in conflicts.items():
+            with self.subTest(email=email):
+                rated = set(
+                    Rating.objects.filter(user__email=email).values_list(
+                        "entry_id", flat=True
+                    )
+                )
+                skipped = set(conflicting.values_list("pk", flat=True))
+                self.assertEqual(
+                    rated, set(entries.values_list("pk", flat=True)) - skipped
+                )
+                if email != "dee@example.com":
+                    self.assertTrue(skipped)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_profile_change_shows_conflicts(self):
+        create_benchmark_data(entries_per_category=2, reviewers=1)
+        reviewer = User.objects.filter(is_staff=False).get()
+        entry = Entry.objects.filter(country="Canada").first()
+        version = grids.get_version(entry.category_id)
+
+        ReviewerProfile.objects.create(user=reviewer, country="Canada")
+        run_on_commit_callbacks()
+
+        self.assertNotEqual(grids.get_version(entry.category_id), version)
+        self.client.force_login(User.objects.get(username="staff"))
+        response = self.client.get(reverse("entry-detail", args=[entry.pk]))
+        self.assertContains(response, "same country")
+
+
+class EntryScoreTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Open Assets Awards")
+        self.entry = Entry.objects.create(entry_id=1, title="Entry", category=category)
+        self.user = User.objects.create(username="reviewer")
+
+    def test_reopened_rating_is_unscored(self):
+        Rating.objects.create(
+            entry=self.entry, user=self.user, status="done", access=8, quality=6
+        )
+        self.assertEqual(EntryScore.objects.get(entry=self.entry).mean, 7)
+
+        rating = Rating.objects.get(entry=self.entry, user=self.user)
+        self.assertEqual(rating.average, 7)
+        rating.status = "draft"
+        rating.save()
+
+        score = EntryScore.objects.get(entry=self.entry)
+        self.assertEqual(score.count, 0)
+        self.assertIsNone(score.mean)
+
+    def test_refresh_updates_in_place(self):
+        Rating.objects.create(
+            entry=self.entry, user=self.user, status="done", individual=4
+        )
+        EntryScore.refresh()
+        EntryScore.refresh([self.entry.pk])
+
+        score = EntryScore.objects.get(entry=self.entry)
+        self.assertEqual((score.count, score.mean), (1, 4))
+
+
+class ExportTest(TestCase):
+    class Sheet:
+        name = "Notes <&> more"
+        columns = [("Text", 100), ("Number", 20), ("Link", 100)]
+
+        def get_rows(self):
+            yield [
+                "a < b & \"c\" 'd' > e\x01",
+                3.5,
+                Link("https://example.com/?a=1&b=2", 'Title "quoted" <b>'),
+            ]
+            yield [None, 7, "Čedad"]
+
+    def read(self, chunks):
+        data = b"".join(chunks)
+        return data, xlrd.open_workbook(file_contents=data)
+
+    def test_cells_read_back(self):
+        data, book = self.read(stream_xlsx([self.Sheet()], chunk_size=1))
+
+        self.assertEqual(book.sheet_names(), ["Notes <&> more"])
+        sheet = book.sheet_by_index(0)
+        self.assertEqual(sheet.row_values(0), ["Text", "Number", "Link"])
+        self.assertEqual(
+            sheet.row_values(1), ["a < b & \"c\" 'd' > e", 3.5, 'Title "quoted" <b>'],
+        )
+        self.assertEqual(sheet.row_values(2), ["", 7, "Čedad"])
+        self.assertEqual(sheet.cell_type(1, 1), xlrd.XL_CELL_NUMBER)
+
+        worksheet = ElementTree.fromstring(
+            zipfile.ZipFile(BytesIO(data)).read("xl/worksheets/sheet1.xml")
+        )
+        formula = worksheet.find(".//{*}c[@r='C2']/{*}f").text
+        self.assertEqual(
+            formula, 'HYPERLINK("https://example.com/?a=1&b=2","Title ""quoted"" <b>")',
+        )
+
+    def test_reviews_export(self):
+        create_benchmark_data(entries_per_category=2, reviewers=3)
+        rating = Rating.dones.order_by("pk").first()
+        rating.comment = "Good & <clear>"
+        rating.save()
+        self.client.force_login(User.objects.get(username="staff"))
+
+        response = self.client.get(reverse("staff-export"))
+        data, book = self.read(response.streaming_content)
+
+        self.assertEqual(
+            book.sheet_names(), [sheet.name for sheet in get_review_sheets()]
+        )
+        _, book = self.read(stream_xlsx([AllReviewsSheet()]))
+        sheet = book.sheet_by_index(0)
+        self.assertEqual(sheet.nrows - 1, Rating.dones.count())
+        self.assertIn("Good & <clear>", sheet.col_values(15))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ResultsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_normalization_removes_reviewer_bias(self):
+        # reviewer 2 scores everything 4 points lower, in the same order
+        entry_ids = np.array([1, 2, 3, 1, 2, 3], dtype=float)
+        user_ids = np.array([1, 1, 1, 2, 2, 2], dtype=float)
+        scores = np.array([9, 7, 5, 5, 3, 1], dtype=float)
+
+        entries, counts, raw_means, means, lows, highs = compute_category(
+            entry_ids, user_ids, scores
+        )
+
+        self.assertEqual(entries.tolist(), [1, 2, 3])
+        self.assertEqual(raw_means.tolist(), [7, 5, 3])
+        # both reviewers agree exactly once their bias is removed
+        np.testing.assert_allclose(lows, means)
+        # z-scores of +-1.22, on the category's scale (mean 5, std 2.58)
+        np.testing.assert_allclose(means, [5 + 10 ** 0.5, 5, 5 - 10 ** 0.5])
+
+    def test_occasional_reviewers_keep_raw_scores(self):
+        # entry 1 is rated 10 and entry 2 is rated 2 by six one-off reviewers
+        entry_ids = np.array([1, 1, 1, 2, 2, 2], dtype=float)
+        user_ids = np.arange(6, dtype=float)
+        scores = np.array([10, 10, 10, 2, 2, 2], dtype=float)
+
+        entries, counts, raw_means, means, lows, highs = compute_category(
+            entry_ids, user_ids, scores
+        )
+        self.assertEqual(means.tolist(), [10, 2])
+
+        # a regular reviewer is normalized alongside them
+        entry_ids = np.append(entry_ids, [1, 2, 3])
+        user_ids = np.append(user_ids, [9, 9, 9])
+        scores = np.append(scores, [6, 5, 4])
+
+        entries, counts, raw_means, means, lows, highs = compute_category(
+            entry_ids, user_ids, scores
+        )
+        self.assertGreater(means[0], means[1])
+        self.assertTrue(np.all(highs[:2] > lows[:2]))
+
+    def test_results_are_ranked_and_cached(self):
+        create_benchmark_data(entries_per_category=5, reviewers=5)
+
+        categories = get_results()
+        self.assertTrue(categories)
+        for category in categories:
+            means = [item["mean"] for item in category["entries"]]
+            self.assertEqual(means, sorted(means, reverse=True))
+            self.assertEqual(category["entries"][0]["rank"], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            get_results()
+        self.assertEqual(len(queries), 0)
+
+        rating = Rating.dones.order_by("pk").first()
+        rating.individual = 10
+        rating.save()
+        run_on_commit_callbacks()
+
+        with CaptureQueriesContext(connection) as queries:
+            get_results()
+        self.assertTrue(queries)
+
+    def test_export_has_results_sheet(self):
+        create_benchmark_data(entries_per_category=2, reviewers=3)
+        self.client.force_login(User.objects.get(username="staff"))
+
+        response = self.client.get(reverse("staff-export"))
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertIn("Ranked Results", archive.read("xl/workbook.xml").decode())
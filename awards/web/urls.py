@@ -7,8 +7,14 @@ from .views import (
     EntryView,
     StaffIndexView,
     UserListView,
+    InviteReviewersView,
+    ReviewerWorkloadView,
     EntryAssignUser,
     AssignmentView,
+    AssignmentBatchView,
+    AssignmentCategoryView,
+    RebalanceView,
+    ResultsView,
     ExportReviews,
 )
 
@@ -31,7 +37,31 @@ urlpatterns = [
         "staff/submissions/", StaffSubmissionsView.as_view(), name="staff-submissions"
     ),
     path("staff/users/", UserListView.as_view(), name="staff-user-list"),
+    path(
+        "staff/users/invite/", InviteReviewersView.as_view(), name="staff-user-invite"
+    ),
+    path(
+        "staff/users/workload.json",
+        ReviewerWorkloadView.as_view(),
+        name="staff-user-workload",
+    ),
     path("staff/assignment/", AssignmentView.as_view(), name="staff-assignment"),
+    path(
+        "staff/assignment/<int:pk>/",
+        AssignmentCategoryView.as_view(),
+        name="staff-assignment-category",
+    ),
+    path(
+        "staff/assignment/batch.json",
+        AssignmentBatchView.as_view(),
+        name="staff-assignment-batch",
+    ),
+    path(
+        "staff/assignment/rebalance/",
+        RebalanceView.as_view(),
+        name="staff-assignment-rebalance",
+    ),
+    path("staff/results/", ResultsView.as_view(), name="staff-results"),
     path("staff/export/", ExportReviews.as_view(), name="staff-export"),
     path("", IndexView.as_view(), name="index"),
 ]
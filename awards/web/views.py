@@ -1,21 +1,28 @@
-import datetime
+import json
+import random
 
-import xlwt
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.db import transaction
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse_lazy, reverse
-from django.utils.safestring import mark_safe
+from django.utils.http import urlencode
 from django.views.generic import FormView, TemplateView, ListView, DetailView
 from django.views.generic.base import View
 from django.views.generic.detail import SingleObjectMixin
 
+from . import ballots, counters, grids, results
+from .affinity import AffinityIndex
+from .assignment import apply_assignments, apply_rebalance, plan_rebalance
+from .exports import AllReviewsSheet, get_review_sheets, stream_csv, stream_xlsx
+from .reports import get_reviewer_workload
 from .utils import StaffuserRequiredMixin
-from .models import LoginKey, Entry, Rating
-from .forms import LoginForm, RatingForm, IndividualRatingForm
+from .models import LoginKey, Category, Entry, Rating, AssignmentMatrix
+from .forms import LoginForm, RatingForm, IndividualRatingForm, RebalanceForm
 
 
 class IndexView(FormView):
@@ -46,17 +53,11 @@ class LoginKeyCheckView(TemplateView):
     template_name = "mail-login/login_failed.html"
 
     def dispatch(self, request, *args, **kwargs):
-        key = kwargs.pop("key")
-        today = datetime.datetime.today()
-        if LoginKey.objects.filter(
-            key=key, pub_date__gte=(today - datetime.timedelta(days=7))
-        ).exists():
-            login_key = LoginKey.objects.get(
-                key=key, pub_date__gte=(today - datetime.timedelta(days=7))
-            )
-
-            login_key.user.backend = "django.contrib.auth.backends.ModelBackend"
-            login(self.request, login_key.user)
+        user_id = LoginKey.use(kwargs.pop("key"))
+        if user_id is not None:
+            user = User.objects.get(pk=user_id)
+            user.backend = "django.contrib.auth.backends.ModelBackend"
+            login(self.request, user)
 
             return redirect(request.GET.get("next", reverse_lazy("submissions")))
 
@@ -68,20 +69,14 @@ class SubmissionsView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
-        context.update(
-            {
-                "draft_entries": Rating.drafts.filter(user=user).order_by(
-                    "entry__category", "entry__subcategory"
-                ),
-                "done_entries": Rating.dones.filter(user=user).order_by(
-                    "entry__category", "entry__subcategory"
-                ),
-                "conflict_entries": Rating.conflicts.filter(user=user).order_by(
-                    "entry__category", "entry__subcategory"
-                ),
-            }
-        )
+        context.update(ballots.get_ballots(self.request.user))
+        if self.request.user.is_staff:
+            # staff see every entry's review counts on the cards
+            counters.annotate_entries(
+                rating.entry
+                for group in set(ballots.STATUS_GROUPS.values())
+                for rating in context[group]
+            )
 
         return context
 
@@ -91,13 +86,7 @@ class StaffIndexView(StaffuserRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context.update(
-            {
-                "drafts": Rating.drafts.count(),
-                "dones": Rating.dones.count(),
-                "conflicts": Rating.conflicts.count(),
-            }
-        )
+        context.update(counters.get_global_counts())
 
         return context
 
@@ -107,7 +96,17 @@ class StaffSubmissionsView(StaffuserRequiredMixin, ListView):
     model = Entry
 
     def get_queryset(self):
-        return self.model.objects.all().order_by("category")
+        return (
+            self.model.objects.select_related("category")
+            .defer("data")
+            .order_by("category")
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        counters.annotate_entries(context["object_list"])
+
+        return context
 
 
 class EntryView(LoginRequiredMixin, View):
@@ -121,114 +120,14 @@ class EntryView(LoginRequiredMixin, View):
 
 
 class EntryDetailView(DetailView):
-    model = Entry
+    # `data` is only needed when the field groups aren't cached
+    queryset = Entry.objects.select_related("category").defer("data")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        data = self.object.data
-
-        materials = []
-        for material in data.get("Additional Support Material (optional)", []):
-            if material:
-                materials.append(
-                    '<a href="{}" target="_blank">{}</a><br /><br />'.format(
-                        material, material.split("/")[-1]
-                    )
-                )
-        materials = mark_safe("\n".join(materials))
-
-        letters = []
-        for letter in data.get("Letter of Support (required if self-nominating)", []):
-            if letter:
-                letters.append(
-                    '<a href="{}" target="_blank">{}</a><br /><br />'.format(
-                        letter, letter.split("/")[-1]
-                    )
-                )
-        letters = mark_safe("\n".join(letters))
-
-        nominee_fields = {}
+        context["groups"] = self.object.get_field_groups(self.request.user.is_staff)
         if self.request.user.is_staff:
-            nominee_fields = {
-                "Name": "{} {}".format(data.get("C_First"), data.get("C_Last")),
-                "Email": data.get("C_Email"),
-                "Twitter": data.get("C_Twitter"),
-            }
-
-        groups = [
-            {
-                "name": "Nominee's Information",
-                "fields": dict(
-                    {
-                        "Title": data.get("Title"),
-                        "Link": data.get("Link"),
-                        "License": data.get("License"),
-                        "Description": data.get("Description")
-                        or data.get("Description (optional)"),
-                        "Institution": data.get("C_Institution"),
-                        "Location": "{}, {}".format(
-                            data.get("City"), data.get("Country")
-                        ),
-                    },
-                    **nominee_fields
-                ),
-            },
-        ]
-
-        if (
-            data.get("Proposed Citation")
-            or data.get("Background")
-            or data.get("Link to Youtube video (optional, but encouraged)")
-            or letters
-            or materials
-            or data.get("Link to Slideshare presentation (optional)")
-        ):
-            groups.append(
-                {
-                    "name": "Supporting materials",
-                    "fields": {
-                        "Proposed Citation": data.get("Proposed Citation"),
-                        "Background": data.get("Background"),
-                        "Youtube video": data.get(
-                            "Link to Youtube video (optional, but encouraged)"
-                        ),
-                        "Letter of Support": letters,
-                        "Additional Support Material": materials,
-                        "Slideshare presentation": data.get(
-                            "Link to Slideshare presentation (optional)"
-                        ),
-                    },
-                },
-            )
-
-        category = self.object.category
-        if self.request.user.is_staff or category.name not in [
-            "Open Assets Awards",
-            "Open Practices Awards",
-        ]:
-            nominator_ppi = {}
-            if self.request.user.is_staff:
-                nominator_ppi = {
-                    "Email": data.get("N_Email"),
-                    "Twitter": data.get("N_Twitter"),
-                }
-
-            groups.append(
-                {
-                    "name": "Nominator's Information",
-                    "fields": dict(
-                        {
-                            "Name": "{} {}".format(
-                                data.get("N_First"), data.get("N_Last")
-                            ),
-                            "Institution": data.get("N_Institution"),
-                        },
-                        **nominator_ppi
-                    ),
-                },
-            ),
-
-        context["groups"] = groups
+            context["reviewers"] = self.get_reviewers()
 
         try:
             rating_instance = Rating.objects.get(
@@ -243,6 +142,22 @@ class EntryDetailView(DetailView):
 
         return context
 
+    def get_reviewers(self):
+        reviewers = self.object.get_reviewers(
+            AssignmentMatrix(
+                entry_id=self.object.pk,
+                affinity=AffinityIndex.build(entry_id=self.object.pk),
+            )
+        )
+        # the matrix only reads this entry's ratings, so loads come from the
+        # cached counters
+        counts = counters.get_user_counts(
+            [reviewer["user"].pk for reviewer in reviewers]
+        )
+        for reviewer in reviewers:
+            reviewer["load"] = sum(counts[reviewer["user"].pk].values())
+        return reviewers
+
 
 class EntryFormView(SingleObjectMixin, FormView):
     template_name = "web/entry_detail.html"
@@ -314,215 +229,334 @@ class EntryFormView(SingleObjectMixin, FormView):
         return reverse_lazy("submissions")
 
 
+def get_workload_filters(request):
+    filters = {"sort": request.GET.get("sort", "name")}
+    for param in ["min_completion", "max_completion"]:
+        try:
+            filters[param] = float(request.GET[param])
+        except (KeyError, ValueError):
+            pass
+
+    return filters
+
+
 class UserListView(StaffuserRequiredMixin, ListView):
     model = User
     template_name = "web-staff/user_list.html"
 
     def get_queryset(self):
-        return self.model.objects.filter(is_active=True, is_superuser=False).order_by(
-            "first_name", "last_name"
-        )
+        filters = get_workload_filters(self.request)
+        self.reported = filters != {"sort": "name"}
+        if not self.reported:
+            return self.model.objects.filter(
+                is_active=True, is_superuser=False
+            ).order_by("first_name", "last_name")
+
+        return get_reviewer_workload(**filters)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
+        # counts come from the report whenever it orders or filters the list,
+        # so they always agree with the order
+        if self.reported:
+            counts = {
+                user.pk: {group: getattr(user, group) for group in counters.GROUPS}
+                for user in context["object_list"]
+            }
+        else:
+            counts = counters.get_user_counts(
+                [user.pk for user in context["object_list"]]
+            )
         data = []
-        for user in self.get_queryset():
-            data.append(
+        for user in context["object_list"]:
+            data.append(dict(counts[user.pk], user=user))
+
+        context["data"] = data
+        return context
+
+
+class InviteReviewersView(StaffuserRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        users = LoginKey.get_invitees(pending="pending" in request.POST)
+        with transaction.atomic():
+            keys = LoginKey.invite(users)
+
+        messages.add_message(
+            request,
+            messages.INFO,
+            "{} login e-mails have been queued for sending.".format(len(keys)),
+        )
+        return redirect(reverse("staff-user-list"))
+
+
+class ReviewerWorkloadView(StaffuserRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        reviewers = []
+        for user in get_reviewer_workload(**get_workload_filters(request)):
+            reviewers.append(
                 {
-                    "user": user,
-                    "dones": user.rating_set(manager="dones").count(),
-                    "conflicts": user.rating_set(manager="conflicts").count(),
-                    "drafts": user.rating_set(manager="drafts").count(),
+                    "id": user.pk,
+                    "name": "{} {}".format(user.first_name, user.last_name),
+                    "email": user.email,
+                    "dones": user.dones,
+                    "conflicts": user.conflicts,
+                    "drafts": user.drafts,
+                    "total": user.total,
+                    "completion": user.completion,
+                    "last_activity": user.last_activity,
                 }
             )
 
-        context["data"] = data
-        return context
+        return JsonResponse({"reviewers": reviewers})
 
 
 class EntryAssignUser(StaffuserRequiredMixin, View):
     def post(self, request, pk, user_id, *args, **kwargs):
-        user = User.objects.get(pk=user_id)
-        entry = Entry.objects.get(pk=pk)
+        rating = Rating.objects.filter(user_id=user_id, entry_id=pk).first()
 
         # if user doesn't have a rating ballot yet, create it
-        if not Rating.objects.filter(user=user, entry=entry).exists():
-            Rating.objects.create(user=user, entry=entry)
-        else:
-            if Rating.conflicts.filter(user=user, entry=entry):
-                Rating.conflicts.filter(user=user, entry=entry).delete()
-
-            if Rating.drafts.filter(user=user, entry=entry):
-                Rating.drafts.filter(user=user, entry=entry).delete()
+        if rating is None:
+            Rating.objects.create(user_id=user_id, entry_id=pk)
+        elif rating.status != "done":
+            rating.delete()
 
         return HttpResponse("ok")
 
 
-class AssignmentView(StaffuserRequiredMixin, ListView):
-    model = Entry
+def parse_assignments(body):
+    """
+    Reads `{"operations": [{"entry": pk, "user": pk, "assign": bool}, ...]}`
+    into sets of (entry_id, user_id) pairs to assign and to unassign; the last
+    operation on a pair wins. Raises ValueError on a malformed body.
+    """
+    try:
+        operations = json.loads(body)["operations"]
+        pairs = {
+            (int(operation["entry"]), int(operation["user"])): bool(operation["assign"])
+            for operation in operations
+        }
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Expected a list of entry, user and assign operations.")
+
+    assign = {pair for pair, value in pairs.items() if value}
+    return assign, set(pairs) - assign
+
+
+class AssignmentBatchView(StaffuserRequiredMixin, View):
+    """
+    Applies many assign/unassign operations in one transaction and returns
+    the new load of every reviewer involved.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            assign, unassign = parse_assignments(request.body)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        pairs = assign | unassign
+        entry_ids = {entry_id for entry_id, user_id in pairs}
+        user_ids = {user_id for entry_id, user_id in pairs}
+        known_entries = Entry.objects.filter(pk__in=entry_ids).count()
+        known_users = User.objects.filter(pk__in=user_ids).count()
+        if known_entries != len(entry_ids) or known_users != len(user_ids):
+            return JsonResponse({"error": "Unknown entry or user."}, status=400)
+
+        apply_assignments(assign, unassign)
+
+        loads = dict.fromkeys(user_ids, 0)
+        loads.update(
+            Rating.objects.filter(user_id__in=user_ids)
+            .values("user_id")
+            .annotate(load=Count("pk"))
+            .values_list("user_id", "load")
+            .order_by()
+        )
+        return JsonResponse({"loads": loads})
+
+
+class AssignmentView(StaffuserRequiredMixin, TemplateView):
+    """
+    Page listing the categories; each category's grid is loaded separately
+    from `AssignmentCategoryView` as it scrolls into view.
+    """
+
     template_name = "web-staff/assignment.html"
-    cat = None
 
-    def get_queryset(self):
-        self.cat = self.request.GET.get("cat")
-        if self.cat:
-            return self.model.objects.filter(category=self.cat).order_by(
-                "category", "entry_id"
-            )
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        categories = (
+            Category.objects.filter(entry__isnull=False).distinct().order_by("name")
+        )
+        context["categories"] = categories
+        context["filtering"] = self.request.GET.get("cat")
+        if context["filtering"]:
+            context["shown_categories"] = categories.filter(pk=context["filtering"])
         else:
-            return self.model.objects.all().order_by("category", "entry_id")
+            context["shown_categories"] = categories
+        return context
 
-    def get_context_data(self, *, object_list=None, **kwargs):
-        context = super().get_context_data()
-        context["categories"] = (
-            self.model.objects.all().values("category__name", "category__id").distinct()
-        )
-        context["filtering"] = bool(self.cat)
 
+class AssignmentCategoryView(StaffuserRequiredMixin, TemplateView):
+    """
+    HTML fragment with a category's entries and their reviewers, cached until
+    a rating in the category changes.
+
+    Reviewer loads span all categories, so the page fills them in from the
+    workload endpoint instead.
+    """
+
+    template_name = "web-staff/assignment_category.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["category"] = get_object_or_404(Category, pk=self.kwargs["pk"])
+        context["grid_version"] = grids.get_version(self.kwargs["pk"])
+        context["grid_timeout"] = grids.TIMEOUT
+        # only called by the template when the fragment isn't cached
+        context["entries"] = self.get_entries
         return context
 
+    def get_entries(self):
+        entries = counters.annotate_entries(
+            Entry.objects.filter(category_id=self.kwargs["pk"])
+            .select_related("category")
+            .defer("data")
+            .order_by("entry_id")
+        )
+        matrix = AssignmentMatrix(
+            category_id=self.kwargs["pk"],
+            affinity=AffinityIndex.build(self.kwargs["pk"]),
+        )
+        for entry in entries:
+            entry.reviewers = matrix.get_reviewers(entry)
+        return entries
+
+
+class RebalanceView(StaffuserRequiredMixin, View):
+    """
+    Previews a rebalancing plan for the given settings (GET) and applies it
+    (POST).
+    """
+
+    template_name = "web-staff/rebalance.html"
+
+    def get_plan(self, form, lock=False):
+        category = form.cleaned_data["category"]
+        return plan_rebalance(
+            form.cleaned_data["reviews"],
+            form.cleaned_data["stale_days"],
+            cap=form.cleaned_data["cap"],
+            category_id=category.pk if category else None,
+            seed=form.cleaned_data["seed"],
+            lock=lock,
+        )
+
+    def get_report(self, plan):
+        entries = Entry.objects.defer("data").in_bulk(
+            {entry_id for entry_id, *_ in plan.moves + plan.additions}
+            | set(plan.shortfalls)
+        )
+        users = User.objects.in_bulk(
+            {
+                user_id
+                for _, *user_ids in plan.moves + plan.additions
+                for user_id in user_ids
+            }
+        )
+        return {
+            "moves": [
+                (entries[entry_id], users[from_user], users[to_user])
+                for entry_id, from_user, to_user in plan.moves
+            ],
+            "additions": [
+                (entries[entry_id], users[user_id])
+                for entry_id, user_id in plan.additions
+            ],
+            "shortfalls": [
+                (entries[entry_id], missing)
+                for entry_id, missing in sorted(plan.shortfalls.items())
+            ],
+        }
 
-class ExportReviews(StaffuserRequiredMixin, View):
     def get(self, request, *args, **kwargs):
-        response = HttpResponse(content_type="application/ms-excel")
-        response["Content-Disposition"] = "attachment; filename=reviews.xls"
-        wb = xlwt.Workbook(encoding="utf-8")
-        ws = wb.add_sheet("Individual Awards", cell_overwrite_ok=True)
-
-        row_num = 0
-        columns = [
-            ("Subcategory", 120),
-            ("ID #", 20),
-            ("Name", 80),
-            ("Reviewer", 70),
-            ("Total", 20),
-            ("Comment", 450),
-        ]
-
-        font_style = xlwt.XFStyle()
-        font_style.font.bold = True
-
-        for col_num in range(len(columns)):
-            ws.write(row_num, col_num, columns[col_num][0], font_style)
-            ws.col(col_num).width = columns[col_num][1] * 100
-
-        font_style = xlwt.XFStyle()
-        font_style.alignment.wrap = 1
-
-        underline = xlwt.XFStyle()
-        underline.font.underline = True
-
-        for obj in Rating.objects.filter(
-            entry__category__name="Individual Awards", status="done",
-        ).order_by("entry__subcategory", "entry__id"):
-            row_num += 1
-
-            row = [
-                obj.entry.subcategory,
-                obj.entry.pk,
-                obj.entry.title,
-                "{} {}".format(obj.user.first_name, obj.user.last_name),
-                obj.individual,
-                obj.comment,
-            ]
-
-            for col_num in range(len(row)):
-                if isinstance(row[col_num], list):
-                    ws.write(row_num, col_num, row[col_num][0], row[col_num][1])
-                else:
-                    ws.write(row_num, col_num, row[col_num], font_style)
-
-            ws.write(
-                row_num,
-                2,
-                xlwt.Formula(
-                    'HYPERLINK("{}";"{}")'.format(
-                        "https://review.awards.oeglobal.org/{}".format(
-                            obj.entry.get_absolute_url()
-                        ),
-                        obj.entry.title,
-                    )
-                ),
-                underline,
+        data = request.GET.copy() or None
+        if data is not None and not data.get("seed"):
+            # the preview's seed is posted back, so the same plan is applied
+            data["seed"] = random.randrange(2 ** 31)
+        form = RebalanceForm(data, initial={"seed": random.randrange(2 ** 31)})
+        context = {"form": form}
+        if form.is_valid():
+            plan = self.get_plan(form)
+            context.update(
+                self.get_report(plan), stats=plan.get_stats(), digest=plan.get_digest()
             )
+        return render(request, self.template_name, context)
 
-        for category in [
-            "Open Assets Awards",
-            "Open Practices Awards",
-            "Special Awards",
-        ]:
-            ws = wb.add_sheet(category, cell_overwrite_ok=True)
-
-            row_num = 0
-            columns = [
-                ("Subcategory", 100),
-                ("ID #", 20),
-                ("Title", 140),
-                ("Reviewer", 70),
-                ("Access", 20),
-                ("Quality", 20),
-                ("Visual", 20),
-                ("Engagement", 35),
-                ("Inclusion", 30),
-                ("Licensing", 30),
-                ("Accessibility", 40),
-                ("Currency", 30),
-                ("Average Score", 60),
-                ("Comment", 450),
-            ]
-
-            font_style = xlwt.XFStyle()
-            font_style.font.bold = True
-
-            for col_num in range(len(columns)):
-                ws.write(row_num, col_num, columns[col_num][0], font_style)
-                ws.col(col_num).width = columns[col_num][1] * 100
-
-            font_style = xlwt.XFStyle()
-            font_style.alignment.wrap = 1
-
-            for obj in Rating.objects.filter(
-                entry__category__name=category, status="done",
-            ).order_by("entry__subcategory", "entry__id"):
-                row_num += 1
-
-                row = [
-                    obj.entry.subcategory,
-                    obj.entry.pk,
-                    obj.entry.title,
-                    "{} {}".format(obj.user.first_name, obj.user.last_name),
-                    obj.access,
-                    obj.quality,
-                    obj.visual,
-                    obj.engagement,
-                    obj.inclusion,
-                    obj.licensing,
-                    obj.accessibility,
-                    obj.currency,
-                    obj.average,
-                    obj.comment,
-                ]
-
-                for col_num in range(len(row)):
-                    if isinstance(row[col_num], list):
-                        ws.write(row_num, col_num, row[col_num][0], row[col_num][1])
-                    else:
-                        ws.write(row_num, col_num, row[col_num], font_style)
-
-                ws.write(
-                    row_num,
-                    2,
-                    xlwt.Formula(
-                        'HYPERLINK("{}";"{}")'.format(
-                            "https://review.awards.oeglobal.org/{}".format(
-                                obj.entry.get_absolute_url()
-                            ),
-                            obj.entry.title,
-                        )
-                    ),
-                    underline,
+    def post(self, request, *args, **kwargs):
+        form = RebalanceForm(request.POST)
+        # without the previewed seed a different plan would be applied
+        form.fields["seed"].required = True
+        if not form.is_valid():
+            return render(request, self.template_name, {"form": form}, status=400)
+
+        with transaction.atomic():
+            plan = self.get_plan(form, lock=True)
+            # ratings or stalled reviewers changed since the preview
+            if plan.get_digest() != request.POST.get("digest"):
+                messages.add_message(
+                    request,
+                    messages.WARNING,
+                    "Ballots changed since the preview, nothing was applied. "
+                    "Check the new plan before applying it.",
                 )
+                query = {
+                    name: value
+                    for name, value in request.POST.items()
+                    if name in form.fields
+                }
+                return redirect(
+                    "{}?{}".format(
+                        reverse("staff-assignment-rebalance"), urlencode(query)
+                    )
+                )
+
+            apply_rebalance(plan)
+
+        messages.add_message(
+            request,
+            messages.INFO,
+            "Moved {moves} ballots and added {additions}.".format(**plan.get_stats()),
+        )
+        return redirect(reverse("staff-assignment"))
+
+
+class ResultsView(StaffuserRequiredMixin, TemplateView):
+    """
+    Entries ranked by reviewer-normalized score, per category.
+    """
+
+    template_name = "web-staff/results.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["categories"] = results.get_results()
+        return context
+
 
-        wb.save(response)
+class ExportReviews(StaffuserRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("format") == "csv":
+            response = StreamingHttpResponse(
+                stream_csv(AllReviewsSheet()), content_type="text/csv"
+            )
+            response["Content-Disposition"] = "attachment; filename=reviews.csv"
+            return response
+
+        response = StreamingHttpResponse(
+            stream_xlsx(get_review_sheets()),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        response["Content-Disposition"] = "attachment; filename=reviews.xlsx"
         return response
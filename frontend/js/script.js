@@ -1,21 +1,22 @@
 import $ from "jquery";
 
-const ratingForm = () => {
-  function getCookie(name) {
-    let cookieValue = null;
-    if (document.cookie && document.cookie !== "") {
-      const cookies = document.cookie.split(";");
-      for (let i = 0; i < cookies.length; i++) {
-        const cookie = cookies[i].trim();
-        // Does this cookie string begin with the name we want?
-        if (cookie.substring(0, name.length + 1) === name + "=") {
-          cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
-          break;
-        }
+function getCookie(name) {
+  let cookieValue = null;
+  if (document.cookie && document.cookie !== "") {
+    const cookies = document.cookie.split(";");
+    for (let i = 0; i < cookies.length; i++) {
+      const cookie = cookies[i].trim();
+      // Does this cookie string begin with the name we want?
+      if (cookie.substring(0, name.length + 1) === name + "=") {
+        cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+        break;
       }
     }
-    return cookieValue;
   }
+  return cookieValue;
+}
+
+const ratingForm = () => {
   const csrftoken = getCookie("csrftoken");
 
   function checkRequiredFields() {
@@ -106,8 +107,78 @@ const ratingForm = () => {
   });
 };
 
+const assignmentGrid = () => {
+  const $page = $(".js-assignment");
+  const csrftoken = getCookie("csrftoken");
+  const loads = {};
+
+  function showLoads() {
+    $page.find(".js-load").each(function () {
+      const load = loads[$(this).data("user")];
+      if (load !== undefined) {
+        $(this).text(load);
+      }
+    });
+  }
+
+  function loadCategory(category) {
+    return $.get($(category).data("url")).then(function (html) {
+      $(category).html(html);
+      showLoads();
+    });
+  }
+
+  // reviewer loads span all categories, so they aren't part of the grids
+  $.getJSON($page.data("workload-url")).then(function (data) {
+    data.reviewers.forEach(function (reviewer) {
+      loads[reviewer.id] = reviewer.total;
+    });
+    showLoads();
+  });
+
+  // fetch each category's grid when it gets close to the viewport
+  const observer = new IntersectionObserver(
+    function (items) {
+      items.forEach(function (item) {
+        if (item.isIntersecting) {
+          observer.unobserve(item.target);
+          loadCategory(item.target);
+        }
+      });
+    },
+    { rootMargin: "500px" }
+  );
+  $page.find(".js-assignment-category").each(function () {
+    observer.observe(this);
+  });
+
+  $page.on("click", ".js-reviewers li", function () {
+    const $reviewer = $(this);
+    const operation = {
+      entry: $reviewer.data("entry"),
+      user: $reviewer.data("user"),
+      assign: !$reviewer.data("assigned"),
+    };
+
+    $.ajax({
+      url: $page.data("batch-url"),
+      type: "POST",
+      contentType: "application/json",
+      headers: { "X-CSRFToken": csrftoken },
+      data: JSON.stringify({ operations: [operation] }),
+    }).then(function (data) {
+      Object.assign(loads, data.loads);
+      loadCategory($reviewer.closest(".js-assignment-category"));
+    });
+
+    return false;
+  });
+};
+
 $(function () {
-  if ($(".js-rating")) {
+  if ($(".js-assignment").length) {
+    assignmentGrid();
+  } else if ($(".js-rating")) {
     ratingForm();
   }
 });